@@ -79,6 +79,34 @@ def main() -> int:
     parser.add_argument("--text", help="Text query (text-to-image search).")
     parser.add_argument("--image", help="Image file path (image-to-image search).")
     parser.add_argument("--limit", type=int, default=int(os.getenv("LIMIT", "20")))
+    parser.add_argument("--workers", type=int, default=5, help="Initial concurrent embedding requests while loading.")
+    parser.add_argument(
+        "--max-workers",
+        type=int,
+        help="Upper bound for the adaptive embedding concurrency. Default: 4x --workers.",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=image_search_data_loader.DEFAULT_BATCH_SIZE,
+        help="Images per embedding call and bulk insert while loading.",
+    )
+    parser.add_argument(
+        "--thumbnail-size",
+        type=int,
+        default=image_search_data_loader.DEFAULT_THUMBNAIL_SIZE,
+        help="Longest side of the images sent for embedding, when loading and for --image. 0 sends the originals.",
+    )
+    parser.add_argument(
+        "--thumbnail-dir",
+        default=image_search_data_loader.DEFAULT_THUMBNAIL_DIR,
+        help="Cache of preprocessed images, keyed by content hash.",
+    )
+    parser.add_argument(
+        "--no-resume",
+        action="store_true",
+        help="Insert every selected image, even those whose image_name is already in the table.",
+    )
     args = parser.parse_args()
 
     db = connect_to_tidb()
@@ -96,6 +124,13 @@ def main() -> int:
             table,
             dataset_dir=args.dataset_dir,
             one_per_breed=one_per_breed,
+            workers=args.workers,
+            batch_size=args.batch_size,
+            embed_fn=embed_fn,
+            resume=not args.no_resume,
+            max_workers=args.max_workers,
+            thumbnail_dir=args.thumbnail_dir if args.thumbnail_size > 0 else None,
+            thumbnail_size=args.thumbnail_size,
         )
         print(f"Loaded {ok}/{total} images.")
 
@@ -107,6 +142,8 @@ def main() -> int:
     query: Any
     if args.text:
         query = args.text
+    elif args.thumbnail_size > 0:
+        query = image_search_data_loader.preprocess_image(Path(args.image), args.thumbnail_dir, args.thumbnail_size)
     else:
         query = Image.open(args.image)
 
@@ -5,12 +5,30 @@ This loads image records from the Oxford Pets dataset into TiDB.
 Embeddings are generated automatically (multimodal embedding model required).
 """
 
+import hashlib
+import io
+import itertools
+import os
+import queue
 import random
 import threading
+import time
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from functools import partial
 from pathlib import Path
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png"}
+DEFAULT_BATCH_SIZE = 16
+# A batch slower than this counts as congestion, like a 429 or a timeout.
+DEFAULT_LATENCY_TARGET = 10.0
+MAX_RETRIES = 4
+RETRY_BACKOFF = 1.0
+MAX_RETRY_BACKOFF = 30.0
+# Longest side of the thumbnails sent for embedding instead of the original files.
+DEFAULT_THUMBNAIL_SIZE = 512
+DEFAULT_THUMBNAIL_DIR = ".thumbnail_cache"
 
 
 def extract_breed_from_filename(filename: str) -> str:
@@ -18,14 +36,179 @@ def extract_breed_from_filename(filename: str) -> str:
     return " ".join(name_parts).replace("_", " ").title()
 
 
-def process_single_image(img_path: Path, table) -> Dict:
-    try:
-        breed = extract_breed_from_filename(img_path.name)
-        image_uri = f"file://{img_path.resolve()}"
-        table.insert({"breed": breed, "image_uri": image_uri, "image_name": img_path.name})
-        return {"success": True, "filename": img_path.name}
-    except Exception as e:
-        return {"success": False, "filename": img_path.name, "error": str(e)}
+def build_row(img_path: Path) -> Dict:
+    return {
+        "breed": extract_breed_from_filename(img_path.name),
+        "image_uri": f"file://{img_path.resolve()}",
+        "image_name": img_path.name,
+    }
+
+
+def iter_images(data_dir: Path) -> Iterator[Path]:
+    """
+    Yield the image files of a directory lazily with os.scandir, so even a huge
+    dataset is never listed into memory.
+    """
+    with os.scandir(data_dir) as entries:
+        for entry in entries:
+            if os.path.splitext(entry.name)[1].lower() in IMAGE_SUFFIXES and entry.is_file():
+                yield Path(entry.path)
+
+
+def sample_one_per_breed(images: Iterable[Path]) -> List[Path]:
+    """
+    Pick one image per breed uniformly at random in a single pass (reservoir
+    sampling of size one), holding a single path per breed.
+    """
+    seen: Dict[str, int] = defaultdict(int)
+    chosen: Dict[str, Path] = {}
+    for p in images:
+        breed = extract_breed_from_filename(p.name)
+        seen[breed] += 1
+        if random.randrange(seen[breed]) == 0:
+            chosen[breed] = p
+    return list(chosen.values())
+
+
+def loaded_image_names(table) -> Set[str]:
+    """
+    Fetch the image_name of every row already in the table with a single query.
+    """
+    with table.client.session():
+        rows = table.client.query(f"SELECT image_name FROM `{table.table_name}`").to_rows()
+    return {row[0] for row in rows}
+
+
+def preprocess_image(
+    img_path: Path,
+    cache_dir: str = DEFAULT_THUMBNAIL_DIR,
+    size: int = DEFAULT_THUMBNAIL_SIZE,
+) -> Path:
+    """
+    Return a JPEG thumbnail of the image whose longest side is at most `size`.
+    Thumbnails are cached under a hash of the file content and the size, so a
+    cached image is only read to hash it and never decoded again.
+    """
+    data = Path(img_path).read_bytes()
+    key = hashlib.sha256(f"{size}\0".encode() + data).hexdigest()
+    thumb = Path(cache_dir) / key[:2] / f"{key}.jpg"
+    if thumb.exists():
+        return thumb
+
+    from PIL import Image, ImageOps
+
+    with Image.open(io.BytesIO(data)) as img:
+        # Let the JPEG decoder downscale while decoding; thumbnail() finishes the resize.
+        img.draft("RGB", (size, size))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+        img.thumbnail((size, size), Image.Resampling.LANCZOS)
+        thumb.parent.mkdir(parents=True, exist_ok=True)
+        tmp = thumb.with_name(f"{thumb.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        img.save(tmp, format="JPEG", quality=90)
+    os.replace(tmp, thumb)
+    return thumb
+
+
+def embed_batch(
+    batch: List[Path],
+    embed_fn=None,
+    vector_field: str = "image_vec",
+    sources: Optional[List[Path]] = None,
+) -> List[Dict]:
+    """
+    Build the rows of one batch and embed all of its images with a single call.
+    `sources` (e.g. thumbnails) are embedded in place of the original files.
+    Without embed_fn the rows are returned as-is and bulk_insert embeds them.
+    """
+    rows = [build_row(p) for p in batch]
+    if embed_fn is not None:
+        uris = [p.resolve().as_uri() for p in sources] if sources else [r["image_uri"] for r in rows]
+        vectors = embed_fn.get_source_embeddings(uris, source_type="image")
+        for row, vector in zip(rows, vectors):
+            row[vector_field] = vector
+    return rows
+
+
+def is_throttled(error: Exception) -> bool:
+    """
+    True for rate limiting and timeouts, which are retried at lower concurrency.
+    """
+    if isinstance(error, TimeoutError) or getattr(error, "status_code", None) in (408, 429):
+        return True
+    name = type(error).__name__
+    return "RateLimit" in name or "Timeout" in name
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on concurrent embedding calls. The limit grows by one after a
+    full window of healthy batches and halves on throttling, timeouts or a
+    batch slower than `latency_target`. Calls started before a decrease cannot
+    trigger another one, so a single burst of 429s halves the limit once.
+    """
+
+    def __init__(self, initial: int, maximum: int, latency_target: float = DEFAULT_LATENCY_TARGET):
+        self.maximum = max(1, maximum)
+        self.limit = min(max(1, initial), self.maximum)
+        self.peak = self.limit
+        self.latency_target = latency_target
+        self.epoch = 0
+        self.healthy = 0
+        self.latencies: List[float] = []
+        self.retries = 0
+        self.throttled = 0
+        self.lock = threading.Lock()
+
+    def success(self, latency: float, epoch: int):
+        with self.lock:
+            self.latencies.append(latency)
+            if latency > self.latency_target:
+                self._decrease(epoch)
+                return
+            self.healthy += 1
+            if self.healthy >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self.peak = max(self.peak, self.limit)
+                self.healthy = 0
+
+    def failure(self, epoch: int, retrying: bool):
+        with self.lock:
+            self.throttled += 1
+            self.retries += retrying
+            self._decrease(epoch)
+
+    def _decrease(self, epoch: int):
+        if epoch == self.epoch:
+            self.limit = max(1, self.limit // 2)
+            self.epoch += 1
+            self.healthy = 0
+
+    def summary(self, images: int, elapsed: float) -> str:
+        rate = images / elapsed if elapsed else 0.0
+        return (
+            f"Embedded {images} images in {elapsed:.1f}s ({rate:.1f} images/s), "
+            f"batch latency p50 {percentile(self.latencies, 50):.2f}s p99 {percentile(self.latencies, 99):.2f}s, "
+            f"{self.retries} retries after {self.throttled} throttled calls, "
+            f"concurrency {self.limit} (peak {self.peak} of {self.maximum})"
+        )
+
+
+def chunked(items: Iterable[Path], size: int) -> Iterator[List[Path]]:
+    batch: List[Path] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
 
 
 def load_images_to_db(
@@ -33,8 +216,40 @@ def load_images_to_db(
     dataset_dir: str = "oxford_pets/images",
     one_per_breed: bool = False,
     workers: int = 5,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    embed_fn=None,
+    vector_field: str = "image_vec",
+    resume: bool = True,
+    max_workers: Optional[int] = None,
+    latency_target: float = DEFAULT_LATENCY_TARGET,
+    thumbnail_dir: Optional[str] = DEFAULT_THUMBNAIL_DIR,
+    thumbnail_size: int = DEFAULT_THUMBNAIL_SIZE,
+    preprocess_workers: Optional[int] = None,
 ) -> Tuple[int, int]:
     """
+    Load images in batches through a two-stage pipeline: worker threads embed
+    batches (one multimodal call each) while an inserter writes finished batches
+    with `bulk_insert`. The directory is scanned lazily and a batch is only read
+    once the pipeline has room for it, so memory stays flat however large the
+    dataset is; `one_per_breed` picks its images in the same single pass.
+
+    Pass the table's `embed_fn` to embed in the worker stage. Concurrency then
+    starts at `workers` and adapts between 1 and `max_workers` (default
+    `workers * 4`) to the endpoint's latency and throttling; throttled batches
+    are retried with backoff. Without `embed_fn` each batch is embedded inside
+    `bulk_insert`, and `workers` fixed inserters are used.
+
+    With `resume` (the default) images whose name is already in the table are
+    skipped, and with `one_per_breed` so are breeds that already have a row, so
+    rerunning after an interruption only loads what is missing.
+
+    With `embed_fn` and a `thumbnail_dir`, images are decoded and shrunk to
+    `thumbnail_size` by `preprocess_workers` threads (default: one per CPU;
+    Pillow releases the GIL while decoding and resizing) and the cached
+    thumbnails are embedded instead of the originals.
+    Rows keep the original `image_uri`. Pass `thumbnail_dir=None` to embed
+    the original files.
+
     Returns: (ok_count, total_count)
     """
     data_dir = Path(dataset_dir)
@@ -43,42 +258,130 @@ def load_images_to_db(
             f"Dataset not found: {data_dir} (download Oxford Pets into ./oxford_pets/images)"
         )
 
-    image_files = [p for p in data_dir.iterdir() if p.suffix.lower() in [".jpg", ".jpeg", ".png"]]
-    if not image_files:
-        raise FileNotFoundError(f"No images found under {data_dir}")
-
+    loaded = loaded_image_names(table) if resume else set()
+    skipped = 0
     if one_per_breed:
-        by_breed: Dict[str, List[Path]] = defaultdict(list)
-        for p in image_files:
-            by_breed[extract_breed_from_filename(p.name)].append(p)
-        images_to_process = [random.choice(v) for v in by_breed.values()]
+        loaded_breeds = {extract_breed_from_filename(name) for name in loaded}
+        sample = sample_one_per_breed(iter_images(data_dir))
+        pending = [p for p in sample if extract_breed_from_filename(p.name) not in loaded_breeds]
+        skipped = len(sample) - len(pending)
+        images: Iterator[Path] = iter(pending)
     else:
-        images_to_process = image_files
 
-    total = len(images_to_process)
+        def unloaded() -> Iterator[Path]:
+            nonlocal skipped
+            for p in iter_images(data_dir):
+                if p.name in loaded:
+                    skipped += 1
+                else:
+                    yield p
+
+        images = unloaded()
+
+    # Look ahead one image: this tells an empty dataset from a fully loaded one.
+    first = next(images, None)
+    if first is None and not skipped:
+        raise FileNotFoundError(f"No images found under {data_dir}")
+    if first is not None:
+        images = itertools.chain([first], images)
+
+    total = 0
     done = 0
     ok = 0
     lock = threading.Lock()
 
-    def update(filename: str, success: bool, error: str | None):
+    def update(batch: List[Path], success: bool, error: str | None):
         nonlocal done, ok
         with lock:
-            done += 1
+            before = done
+            done += len(batch)
             if success:
-                ok += 1
-            if done == 1 or done % 50 == 0 or done == total:
-                print(f"[{done}/{total}] {filename}")
+                ok += len(batch)
+            if before == 0 or before // 50 != done // 50:
+                print(f"[{done}] {batch[-1].name}")
             if error:
-                print(f"  ERROR: {error}")
+                print(f"  ERROR ({len(batch)} images from {batch[0].name}): {error}")
+
+    if embed_fn is not None:
+        controller = AdaptiveConcurrency(workers, max_workers or workers * 4, latency_target)
+    else:
+        controller = AdaptiveConcurrency(workers, workers)
+
+    # Embedded batches waiting for the inserter; put() blocks when it falls behind.
+    ready: "queue.Queue[Optional[Tuple[List[Path], List[Dict]]]]" = queue.Queue(maxsize=controller.maximum * 2)
+
+    def insert_loop():
+        while True:
+            item = ready.get()
+            if item is None:
+                return
+            batch, rows = item
+            try:
+                table.bulk_insert(rows)
+                update(batch, True, None)
+            except Exception as e:
+                update(batch, False, str(e))
 
-    with ThreadPoolExecutor(max_workers=workers) as executor:
-        futures = {executor.submit(process_single_image, p, table): p for p in images_to_process}
-        for fut in as_completed(futures):
-            p = futures[fut]
+    inserters = [threading.Thread(target=insert_loop, daemon=True) for _ in range(1 if embed_fn else workers)]
+    for t in inserters:
+        t.start()
+
+    preprocess_pool = None
+    if embed_fn is not None and thumbnail_dir:
+        preprocess_pool = ThreadPoolExecutor(max_workers=preprocess_workers or os.cpu_count() or 1)
+        make_thumbnail = partial(preprocess_image, cache_dir=thumbnail_dir, size=thumbnail_size)
+
+    def embed_with_retries(batch: List[Path]) -> List[Dict]:
+        sources = list(preprocess_pool.map(make_thumbnail, batch)) if preprocess_pool else None
+        attempt = 0
+        while True:
+            epoch = controller.epoch
+            started = time.perf_counter()
+            try:
+                rows = embed_batch(batch, embed_fn, vector_field, sources)
+            except Exception as e:
+                if not is_throttled(e):
+                    raise
+                controller.failure(epoch, retrying=attempt < MAX_RETRIES)
+                if attempt == MAX_RETRIES:
+                    raise
+                time.sleep(min(MAX_RETRY_BACKOFF, RETRY_BACKOFF * 2**attempt) * random.uniform(0.5, 1.0))
+                attempt += 1
+                continue
+            controller.success(time.perf_counter() - started, epoch)
+            return rows
+
+    in_flight: Dict[Future, List[Path]] = {}
+
+    def drain():
+        finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for fut in finished:
+            batch = in_flight.pop(fut)
             try:
-                res = fut.result()
-                update(res["filename"], res["success"], res.get("error"))
+                ready.put((batch, fut.result()))
             except Exception as e:
-                update(p.name, False, str(e))
+                update(batch, False, str(e))
+
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=controller.maximum) as executor:
+            for batch in chunked(images, batch_size):
+                while len(in_flight) >= controller.limit:
+                    drain()
+                in_flight[executor.submit(embed_with_retries, batch)] = batch
+                total += len(batch)
+            while in_flight:
+                drain()
+    finally:
+        for _ in inserters:
+            ready.put(None)
+        for t in inserters:
+            t.join()
+        if preprocess_pool is not None:
+            preprocess_pool.shutdown()
 
+    if skipped:
+        print(f"Skipped {skipped} {'breeds' if one_per_breed else 'images'} already loaded.")
+    if embed_fn is not None and total:
+        print(controller.summary(ok, time.perf_counter() - started))
     return ok, total
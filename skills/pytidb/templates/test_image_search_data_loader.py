@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+AIMD check for image_search_data_loader against a stub embedding server.
+
+The stub answers up to `capacity` concurrent calls and returns 429 beyond
+that, with latency growing with concurrency. Run the check with
+``python -m pytest test_image_search_data_loader.py`` or watch a load with
+``python test_image_search_data_loader.py [--capacity N] [--images N]``.
+"""
+
+import argparse
+import json
+import statistics
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import image_search_data_loader as loader
+
+
+class StubEmbeddingServer(ThreadingHTTPServer):
+    """
+    Embeds a JSON list of URIs as 2-d vectors. Calls beyond `capacity` in
+    flight get a 429; the others take longer the more calls are in flight.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, capacity: int):
+        super().__init__(("127.0.0.1", 0), StubEmbeddingHandler)
+        self.capacity = capacity
+        self.active = 0
+        self.rejected = 0
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/"
+
+
+class StubEmbeddingHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        uris = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        with server.lock:
+            server.active += 1
+            active = server.active
+        try:
+            if active > server.capacity:
+                with server.lock:
+                    server.rejected += 1
+                self.send_response(429)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            time.sleep(0.02 + 0.005 * active)
+            body = json.dumps([[0.1, 0.2] for _ in uris]).encode()
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with server.lock:
+                server.active -= 1
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+class StubEmbeddingFunction:
+    def __init__(self, url: str):
+        self.url = url
+
+    def get_source_embeddings(self, uris: List[str], source_type: str = "image") -> List[List[float]]:
+        request = urllib.request.Request(self.url, data=json.dumps(uris).encode(), method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                raise RateLimitError("429 Too Many Requests") from None
+            raise
+
+
+class RecordingTable:
+    def __init__(self):
+        self.rows: List[Dict] = []
+        self.lock = threading.Lock()
+
+    def bulk_insert(self, rows: List[Dict]):
+        with self.lock:
+            self.rows.extend(rows)
+
+
+class RecordingConcurrency(loader.AdaptiveConcurrency):
+    """
+    Keeps every value the limit takes, and the last instance created.
+    """
+
+    last = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.history = [self.limit]
+        RecordingConcurrency.last = self
+
+    def success(self, latency: float, epoch: int):
+        super().success(latency, epoch)
+        self.history.append(self.limit)
+
+    def failure(self, epoch: int, retrying: bool):
+        super().failure(epoch, retrying)
+        self.history.append(self.limit)
+
+
+def run_load(
+    capacity: int, images: int, workers: int = 1, max_workers: int = 32
+) -> Tuple[RecordingTable, RecordingConcurrency, int]:
+    """
+    Load `images` placeholder files through the stub and return the table,
+    the concurrency controller and the number of 429s the stub sent.
+    """
+    original = (loader.AdaptiveConcurrency, loader.RETRY_BACKOFF)
+    loader.AdaptiveConcurrency, loader.RETRY_BACKOFF = RecordingConcurrency, 0.01
+    server = StubEmbeddingServer(capacity)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            for i in range(images):
+                Path(data_dir, f"great_pyrenees_{i}.jpg").write_bytes(b"")
+            table = RecordingTable()
+            loader.load_images_to_db(
+                table,
+                data_dir,
+                workers=workers,
+                batch_size=8,
+                embed_fn=StubEmbeddingFunction(server.url),
+                resume=False,
+                max_workers=max_workers,
+                thumbnail_dir=None,
+            )
+    finally:
+        server.shutdown()
+        server.server_close()
+        loader.AdaptiveConcurrency, loader.RETRY_BACKOFF = original
+    return table, RecordingConcurrency.last, server.rejected
+
+
+def test_limit_settles_near_capacity_and_rows_are_inserted_once():
+    capacity = 6
+    table, controller, rejected = run_load(capacity, images=2000)
+
+    names = [row["image_name"] for row in table.rows]
+    assert len(names) == 2000
+    assert len(set(names)) == 2000
+    assert all(row["image_vec"] == [0.1, 0.2] for row in table.rows)
+
+    # Starting from 1, the limit must climb to the threshold, get throttled
+    # there and then saw-tooth around it, between about half and one above.
+    assert rejected > 0
+    assert controller.peak <= capacity + 2
+    settled = controller.history[len(controller.history) // 2 :]
+    assert capacity // 2 <= statistics.median(settled) <= capacity + 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load placeholder images through a stub embedding server.")
+    parser.add_argument("--capacity", type=int, default=6, help="Concurrent calls the stub accepts. Default: 6")
+    parser.add_argument("--images", type=int, default=2000, help="Images to load. Default: 2000")
+    args = parser.parse_args()
+    table, controller, rejected = run_load(args.capacity, args.images)
+    settled = controller.history[len(controller.history) // 2 :]
+    print(
+        f"{len(table.rows)} rows ({len({row['image_name'] for row in table.rows})} distinct), "
+        f"{rejected} calls throttled by the stub, limit peaked at {controller.peak}, "
+        f"settled median {statistics.median(settled)} (range {min(settled)}-{max(settled)}) "
+        f"against a capacity of {args.capacity}"
+    )
+
+
+if __name__ == "__main__":
+    main()
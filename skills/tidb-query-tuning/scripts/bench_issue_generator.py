@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import generate_tidb_issue_experiences as generator
+
+
+# Generator functions whose cumulative time is reported. They are looked up
+# as module globals at call time, so wrapping the module attribute is enough.
+PROFILED_FUNCTIONS = ["sanitize_text", "extract_phenomenon", "render_issue"]
+
+
+def parse_args(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    # Everything after "--" is passed through to the generator.
+    split = argv.index("--") if "--" in argv else len(argv)
+    parser = argparse.ArgumentParser(
+        description="Benchmark generate_tidb_issue_experiences.py offline against fixtures saved with --record.",
+        epilog="Generator arguments go after '--', e.g. -- --graphql --concurrency 8. "
+        "They must select the same requests as the recorded run.",
+    )
+    parser.add_argument("fixtures", help="Fixture directory written by generate_tidb_issue_experiences.py --record.")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of measured runs. Default: 3")
+    parser.add_argument("--json", action="store_true", help="Print the per-run measurements as JSON.")
+    args = parser.parse_args(argv[:split])
+    args.generator_args = argv[split + 1 :]
+    if args.repeat < 1:
+        parser.error("--repeat must be at least 1")
+    if not (Path(args.fixtures) / generator.FIXTURE_META_NAME).is_file():
+        parser.error(f"{args.fixtures} is not a fixture directory (no {generator.FIXTURE_META_NAME})")
+    return args
+
+
+class FunctionTimer:
+    """Accumulates call counts and wall time of wrapped module functions across threads."""
+
+    def __init__(self, module, names):
+        self.module = module
+        self.originals = {name: getattr(module, name) for name in names}
+        self.lock = threading.Lock()
+        self.calls = dict.fromkeys(names, 0)
+        self.secs = dict.fromkeys(names, 0.0)
+
+    def wrap(self, name, func):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self.lock:
+                    self.calls[name] += 1
+                    self.secs[name] += elapsed
+
+        return timed
+
+    def __enter__(self):
+        for name, func in self.originals.items():
+            setattr(self.module, name, self.wrap(name, func))
+        return self
+
+    def __exit__(self, *exc_info):
+        for name, func in self.originals.items():
+            setattr(self.module, name, func)
+
+
+def reset_generator_state():
+    """Clear memoized text processing so every run starts cold."""
+    for name in ("sanitize_text", "section_index"):
+        getattr(generator, name).cache_clear()
+
+
+def run_once(fixtures, generator_args):
+    reset_generator_state()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Rendering stays in this process unless overridden, so the function timers see every call.
+        argv = ["--replay", fixtures, "--out-dir", str(Path(tmp) / "out"), "--render-processes", "0"]
+        argv.extend(generator_args)
+        with FunctionTimer(generator, PROFILED_FUNCTIONS) as timer, contextlib.redirect_stdout(io.StringIO()):
+            started = time.perf_counter()
+            generator.main(argv)
+            wall = time.perf_counter() - started
+        issues = len(generator.read_jsonl(Path(tmp) / "out" / generator.EXPORT_JSONL_NAME))
+    return {
+        "wall_secs": round(wall, 4),
+        "issues": issues,
+        "requests": generator.TRANSPORT.requests,
+        "bytes_parsed": generator.TRANSPORT.bytes,
+        "functions": {
+            name: {"calls": timer.calls[name], "secs": round(timer.secs[name], 4)} for name in PROFILED_FUNCTIONS
+        },
+    }
+
+
+def print_report(runs):
+    header = f"{'run':>4} {'wall s':>8} {'issues':>7} {'requests':>9} {'MB parsed':>10}  "
+    print(header + "  ".join(f"{name + ' s':>20}" for name in PROFILED_FUNCTIONS))
+    for i, run in enumerate(runs, 1):
+        print(
+            f"{i:>4} {run['wall_secs']:>8.3f} {run['issues']:>7} {run['requests']:>9} {run['bytes_parsed'] / 1e6:>10.2f}  "
+            + "  ".join(f"{run['functions'][name]['secs']:>20.4f}" for name in PROFILED_FUNCTIONS)
+        )
+    walls = [run["wall_secs"] for run in runs]
+    print(f"[bench] median wall {statistics.median(walls):.3f}s, best {min(walls):.3f}s over {len(runs)} runs")
+
+
+def main():
+    args = parse_args()
+    runs = [run_once(args.fixtures, args.generator_args) for _ in range(args.repeat)]
+    if args.json:
+        print(json.dumps(runs, indent=2))
+        return
+    print_report(runs)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:
+        print(str(exc), file=sys.stderr)
+        sys.exit(1)
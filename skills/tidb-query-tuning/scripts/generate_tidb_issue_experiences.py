@@ -1,23 +1,76 @@
 #!/usr/bin/env python3
 import argparse
+import bisect
+import contextlib
+import functools
+import gzip
+import hashlib
+import http.client
+import importlib.util
+import itertools
 import json
+import multiprocessing
+import os
+import queue
+import random
 import re
+import shutil
 import subprocess
 import sys
+import threading
 import time
-from collections import Counter
-from datetime import datetime, timedelta
+from collections import Counter, defaultdict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
+from urllib.parse import urlencode, urlsplit
+
+import precedent_index
+import precedent_vectors
 
 
 REPO = "pingcap/tidb"
 DEFAULT_QUERY = 'repo:pingcap/tidb is:issue label:"report/customer" label:"sig/planner" created:>=2024-01-01'
 DEFAULT_OUT_DIR = Path("outputs/tidb-customer-planner-issues")
-MAX_RETRIES = 3
-SLEEP_SECS = 0.15
+DEFAULT_CACHE_DIR = Path("outputs/.gh-api-cache")
+DEFAULT_API_URL = "https://api.github.com"
+HTTP_TIMEOUT_SECS = 30
+MAX_RETRIES = 5
+MAX_REDIRECTS = 5
+REDIRECT_STATUSES = {301, 302, 307, 308}
+BACKOFF_BASE_SECS = 1.0
+BACKOFF_MAX_SECS = 60.0
+MIN_REQUESTS_PER_SEC = 0.2
+RATE_LIMIT_RESERVE_FRACTION = 0.1
+WAIT_CAUSES = ("limited", "pacing", "backoff")
+# Starting (rate, burst) per rate-limit resource. The core rate stays below the
+# secondary limit of 900 REST points per minute; search allows 30 calls per minute.
+RATE_LIMIT_RESOURCES = {"core": (15.0, 10), "search": (0.5, 5), "graphql": (5.0, 5)}
+PERMANENT_HTTP_STATUSES = {400, 401, 404, 410, 422}
+SEARCH_RESULT_CAP = 1000
+SEARCH_EPOCH = datetime(2008, 1, 1, tzinfo=timezone.utc)
+MANIFEST_NAME = ".manifest.json"
+MANIFEST_VERSION = 1
+CHECKPOINT_NAME = ".checkpoint.jsonl"
+CHECKPOINT_VERSION = 2
+EXPORT_JSONL_NAME = "issues.jsonl"
+EXPORT_PARQUET_NAME = "issues.parquet"
+DEFAULT_GRAPHQL_BATCH_SIZE = 25
+WRITE_BATCH_SIZE = 10
+# Issues sent to a render worker per task; one issue renders in well under a
+# millisecond, so a task per issue would cost more in IPC than it saves.
+RENDER_CHUNK_SIZE = 32
+FIXTURE_META_NAME = "fixture.json"
+# Rate limits do not apply when answering from recorded fixtures.
+UNTHROTTLED_RESOURCES = {name: (1e9, 10**9) for name in RATE_LIMIT_RESOURCES}
+# Upper bounds in milliseconds of the stage latency histogram buckets.
+LATENCY_BUCKETS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 30000]
+SAMPLED_FILE_PAGES = 2
+MODULE_RULES_DIR = Path(__file__).resolve().parent / "module_rules"
+DEFAULT_BUCKET_DEPTH = 2
 
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(
         description="Generate a local markdown corpus from GitHub issue and PR history."
     )
@@ -31,61 +84,1005 @@ def parse_args():
         default=DEFAULT_QUERY,
         help="GitHub issue search query used by gh api search/issues.",
     )
+    parser.add_argument(
+        "--full-file-lists",
+        action="store_true",
+        help=f"Page through every changed file of each PR. By default only the first {SAMPLED_FILE_PAGES} pages "
+        "are fetched and module buckets of larger PRs are estimated from them.",
+    )
+    parser.add_argument(
+        "--module-rules",
+        help="JSON file of path prefix -> module bucket rules for PR file summaries. "
+        "Default: module_rules/<owner>/<name>.json for --repo when it exists, else the first two path components.",
+    )
     parser.add_argument(
         "--out-dir",
         default=str(DEFAULT_OUT_DIR),
         help="Directory where issue markdown files and README.md are written.",
     )
-    return parser.parse_args()
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=1,
+        help="Number of issues whose timelines and PRs are fetched in parallel. Default: 1",
+    )
+    parser.add_argument(
+        "--render-processes",
+        type=int,
+        default=0,
+        help="Worker processes that summarize PRs and render markdown while fetching continues, "
+        f"in chunks of {RENDER_CHUNK_SIZE} issues. Rendering takes under a millisecond per issue, so "
+        "worker start-up usually costs more than it saves. Default: 0 (render in the main process)",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=str(DEFAULT_CACHE_DIR),
+        help="Directory for the on-disk API response cache. Default: outputs/.gh-api-cache",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disable the response cache and always download full responses.",
+    )
+    parser.add_argument(
+        "--cache-max-age",
+        type=float,
+        default=0,
+        help="Serve cached responses younger than this many seconds without revalidating them. Default: 0",
+    )
+    parser.add_argument(
+        "--transport",
+        choices=["auto", "http", "gh"],
+        default="auto",
+        help="API backend: 'http' keeps pooled keep-alive connections in-process, 'gh' spawns 'gh api' per request, "
+        "'auto' uses http when a token is available and falls back to gh. Default: auto",
+    )
+    parser.add_argument(
+        "--api-url",
+        default=DEFAULT_API_URL,
+        help="Base REST API URL for the http transport. Default: https://api.github.com",
+    )
+    parser.add_argument(
+        "--record",
+        metavar="DIR",
+        help="Save every API response under DIR so the run can be replayed offline. Disables the response cache.",
+    )
+    parser.add_argument(
+        "--replay",
+        metavar="DIR",
+        help="Answer every API request from responses saved with --record instead of contacting GitHub. "
+        "The clock is pinned to the recording time and rate limiting is off.",
+    )
+    parser.add_argument(
+        "--graphql",
+        action="store_true",
+        help="Fetch timelines, PR metadata and changed files in batched GraphQL queries instead of per-issue REST calls.",
+    )
+    parser.add_argument(
+        "--graphql-batch-size",
+        type=int,
+        default=DEFAULT_GRAPHQL_BATCH_SIZE,
+        help=f"Number of issues or PRs requested per GraphQL query. Default: {DEFAULT_GRAPHQL_BATCH_SIZE}",
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help=f"Only refetch and re-render issues whose upstream state changed since the last run, tracked in {MANIFEST_NAME} under --out-dir.",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help=f"Continue an interrupted run from {CHECKPOINT_NAME} under --out-dir, skipping issues it already finished.",
+    )
+    parser.add_argument(
+        "--no-jsonl",
+        action="store_true",
+        help=f"Do not write the structured {EXPORT_JSONL_NAME} export next to the markdown files.",
+    )
+    parser.add_argument(
+        "--parquet",
+        action="store_true",
+        help=f"Also write the structured export as {EXPORT_PARQUET_NAME}. Requires pyarrow.",
+    )
+    parser.add_argument(
+        "--embed",
+        action="store_true",
+        help="Also embed each issue's phenomenon and PR summaries into a local vector index for "
+        "precedent_vectors.py query. Requires numpy and sentence-transformers.",
+    )
+    parser.add_argument(
+        "--embed-model",
+        default=precedent_vectors.DEFAULT_MODEL,
+        help=f"sentence-transformers model for --embed, loaded from the local cache. Default: {precedent_vectors.DEFAULT_MODEL}",
+    )
+    parser.add_argument(
+        "--trace",
+        metavar="FILE",
+        help="Write per-request and per-stage timings as a Chrome trace-event JSON file, "
+        "viewable in Perfetto or chrome://tracing, with the run summary under 'summary'.",
+    )
+    parser.add_argument(
+        "--index",
+        nargs="?",
+        const=str(precedent_index.DEFAULT_INDEX),
+        metavar="PATH",
+        help="After the run, add --out-dir to the precedent search index at PATH and refresh it. "
+        f"PATH defaults to references/{precedent_index.INDEX_NAME}, the index precedent_index.py searches.",
+    )
+    args = parser.parse_args(argv)
+    if args.record and args.replay:
+        parser.error("--record and --replay cannot be combined")
+    if args.replay and not (Path(args.replay) / FIXTURE_META_NAME).is_file():
+        parser.error(f"--replay directory has no {FIXTURE_META_NAME}: {args.replay}")
+    if args.parquet and args.no_jsonl:
+        parser.error("--parquet is built from the JSONL export and cannot be combined with --no-jsonl")
+    if args.parquet and importlib.util.find_spec("pyarrow") is None:
+        parser.error("--parquet requires pyarrow (pip install pyarrow)")
+    if args.embed and args.no_jsonl:
+        parser.error("--embed reads the JSONL export and cannot be combined with --no-jsonl")
+    if args.embed and not all(importlib.util.find_spec(name) for name in ("numpy", "sentence_transformers")):
+        parser.error("--embed requires numpy and sentence-transformers (pip install numpy sentence-transformers)")
+    if args.module_rules and not Path(args.module_rules).is_file():
+        parser.error(f"--module-rules file not found: {args.module_rules}")
+    if args.concurrency < 1:
+        parser.error("--concurrency must be at least 1")
+    if args.render_processes < 0:
+        parser.error("--render-processes must not be negative")
+    if args.cache_max_age < 0:
+        parser.error("--cache-max-age must not be negative")
+    if not 1 <= args.graphql_batch_size <= 100:
+        parser.error("--graphql-batch-size must be between 1 and 100")
+    return args
 
 
-def run(cmd):
-    proc = subprocess.run(cmd, capture_output=True, text=True)
-    if proc.returncode != 0:
-        raise RuntimeError(
-            f"command failed: {' '.join(cmd)}\nstdout:\n{proc.stdout}\nstderr:\n{proc.stderr}"
+class ApiError(RuntimeError):
+    def __init__(self, message, status=None, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def rate_limit_resource(args):
+    if args[0] == "graphql":
+        return "graphql"
+    if args[0].startswith("search/"):
+        return "search"
+    return "core"
+
+
+def is_rate_limited(exc):
+    if exc.status == 429 or "retry-after" in exc.headers:
+        return True
+    return exc.status == 403 and (
+        exc.headers.get("x-ratelimit-remaining") == "0" or "rate limit" in str(exc).lower()
+    )
+
+
+def is_retryable(exc):
+    if not isinstance(exc, ApiError):
+        return True
+    if exc.status in PERMANENT_HTTP_STATUSES or exc.status in REDIRECT_STATUSES:
+        return False
+    if exc.status == 403:
+        return is_rate_limited(exc)
+    return True
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.max_rate = rate
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class RateLimitScheduler:
+    """Shares GitHub's rate-limit budget between all worker threads.
+
+    Each rate-limit resource (core, search, graphql) has a token bucket that
+    refills at the secondary-limit-safe rate while quota is plentiful. Once
+    X-RateLimit-Remaining drops below a reserve of the window's limit, the
+    rate is lowered so the rest of the quota lasts until X-RateLimit-Reset.
+    An exhausted quota or a Retry-After header
+    blocks the resource until it resets, and failed attempts back off
+    exponentially with full jitter.
+
+    Waits are recorded by cause: ``limited`` (Retry-After, an exhausted
+    quota or a lowered rate), ``pacing`` (the steady secondary-limit-safe
+    rate) and ``backoff`` (between retries). Each is wall time during which
+    at least one worker was waiting for that cause, not a sum over workers.
+    """
+
+    def __init__(self, resources=None):
+        self.lock = threading.Lock()
+        self.buckets = {
+            name: TokenBucket(rate, burst) for name, (rate, burst) in (resources or RATE_LIMIT_RESOURCES).items()
+        }
+        self.waiting = dict.fromkeys(WAIT_CAUSES, 0)
+        self.wait_started = dict.fromkeys(WAIT_CAUSES, 0.0)
+        self.wait_secs = dict.fromkeys(WAIT_CAUSES, 0.0)
+        self.retries = 0
+        self.permanent_failures = 0
+
+    def acquire(self, resource):
+        bucket = self.buckets[resource]
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                bucket.refill(now)
+                if now >= bucket.blocked_until and bucket.tokens >= 1:
+                    bucket.tokens -= 1
+                    return
+                wait = max(bucket.blocked_until - now, (1 - bucket.tokens) / bucket.rate)
+                cause = "limited" if now < bucket.blocked_until or bucket.rate < bucket.max_rate else "pacing"
+            self.sleep(wait, cause)
+
+    def observe(self, resource, headers):
+        bucket = self.buckets[resource]
+        now = time.monotonic()
+        with self.lock:
+            retry_after = headers.get("retry-after", "")
+            if retry_after.isdigit():
+                bucket.blocked_until = max(bucket.blocked_until, now + int(retry_after))
+            remaining = headers.get("x-ratelimit-remaining", "")
+            reset = headers.get("x-ratelimit-reset", "")
+            limit = headers.get("x-ratelimit-limit", "")
+            if not (remaining.isdigit() and reset.isdigit()):
+                return
+            remaining = int(remaining)
+            limit = int(limit) if limit.isdigit() else 0
+            window = max(int(reset) - time.time(), 1.0)
+            if remaining == 0:
+                bucket.blocked_until = max(bucket.blocked_until, now + window + 1)
+                bucket.tokens = 0.0
+            elif remaining > limit * RATE_LIMIT_RESERVE_FRACTION:
+                bucket.rate = bucket.max_rate
+            else:
+                bucket.rate = min(bucket.max_rate, max(MIN_REQUESTS_PER_SEC, remaining / window))
+
+    def backoff(self, attempt):
+        with self.lock:
+            self.retries += 1
+        self.sleep(random.uniform(0, min(BACKOFF_MAX_SECS, BACKOFF_BASE_SECS * 2**attempt)), "backoff")
+
+    def record_permanent_failure(self):
+        with self.lock:
+            self.permanent_failures += 1
+
+    def sleep(self, secs, cause):
+        # Only the first worker to start and the last to stop waiting for a
+        # cause move its clock, so overlapping waits count once.
+        with self.lock:
+            if not self.waiting[cause]:
+                self.wait_started[cause] = time.monotonic()
+            self.waiting[cause] += 1
+        try:
+            time.sleep(secs)
+        finally:
+            with self.lock:
+                self.waiting[cause] -= 1
+                if not self.waiting[cause]:
+                    self.wait_secs[cause] += time.monotonic() - self.wait_started[cause]
+
+    def summary(self):
+        waits = ", ".join(f"{self.wait_secs[cause]:.1f}s {cause}" for cause in WAIT_CAUSES)
+        return (
+            f"[rate-limit] waited {waits} (wall time), {self.retries} retries, "
+            f"{self.permanent_failures} permanent failures"
         )
-    return proc.stdout
+
+
+SCHEDULER = RateLimitScheduler()
+
+
+def fixture_path(root, args, api_url=None):
+    """Path under ``root`` of the stored response to a ``gh api`` argument list.
+
+    Shared by the response cache and the record/replay fixtures so they
+    always agree on the key format and layout. The response cache also keys
+    by ``api_url`` so github.com and GitHub Enterprise entries never mix.
+    """
+    key = hashlib.sha256(json.dumps(args if api_url is None else [api_url, args]).encode("utf-8")).hexdigest()
+    return Path(root) / key[:2] / f"{key}.json"
+
+
+class ResponseCache:
+    """On-disk store of API responses with their validators.
+
+    Entries are keyed by a hash of the API base URL and the full ``gh api``
+    argument list (path, parameters and headers). Each entry keeps the raw body together with the
+    ETag/Last-Modified headers so later runs can send conditional requests and
+    reuse the body when GitHub answers 304 Not Modified.
+    """
+
+    def __init__(self, root, max_age=0, api_url=DEFAULT_API_URL):
+        self.root = Path(root)
+        self.max_age = max_age
+        self.api_url = api_url.rstrip("/")
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    def load(self, args):
+        try:
+            return json.loads(fixture_path(self.root, args, self.api_url).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def store(self, args, headers, body):
+        entry = {
+            "args": args,
+            "etag": headers.get("etag"),
+            "last_modified": headers.get("last-modified"),
+            "fetched_at": time.time(),
+            "body": body,
+        }
+        path = fixture_path(self.root, args, self.api_url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_text(path, json.dumps(entry))
+
+    def revalidated(self, args, entry, headers):
+        """Restart the --cache-max-age window of an entry GitHub just confirmed with a 304."""
+        if self.max_age > 0:
+            validators = {
+                "etag": headers.get("etag") or entry.get("etag"),
+                "last-modified": headers.get("last-modified") or entry.get("last_modified"),
+            }
+            self.store(args, validators, entry["body"])
+
+    def is_fresh(self, entry):
+        return self.max_age > 0 and time.time() - entry.get("fetched_at", 0) < self.max_age
+
+    def conditional_headers(self, entry):
+        headers = {}
+        if entry and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        return headers
+
+    def record(self, outcome):
+        with self.lock:
+            self.stats[outcome] += 1
+
+    def summary(self):
+        return (
+            f"[cache] {self.stats['fresh']} fresh, {self.stats['revalidated']} revalidated (304), "
+            f"{self.stats['miss']} downloaded"
+        )
+
+
+RESPONSE_CACHE = None
+
+
+def endpoint_name(args):
+    """Group a ``gh api`` path by endpoint: repository and numeric path segments become placeholders."""
+    path = re.sub(r"^repos/[^/]+/[^/]+/", "repos/{repo}/", args[0])
+    return re.sub(r"/\d+(?=/|$)", "/{n}", path)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class Instrumentation:
+    """Counts API requests per endpoint and times pipeline stages.
+
+    Requests are grouped by ``endpoint_name`` with their retries, response
+    bytes and time on the wire. Stages (search, timeline, pr, files, render,
+    write, checkpoint) keep every duration for percentiles and a latency histogram.
+    With ``trace`` set every request and stage is also kept as a Chrome
+    trace event.
+    """
+
+    def __init__(self, trace=False):
+        self.lock = threading.Lock()
+        self.origin = time.perf_counter()
+        self.requests = Counter()
+        self.retries = Counter()
+        self.failures = Counter()
+        self.bytes = Counter()
+        self.request_secs = Counter()
+        self.stages = defaultdict(list)
+        self.events = [] if trace else None
+
+    def event(self, name, category, started, secs, fields):
+        self.events.append(
+            {
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": round((started - self.origin) * 1e6),
+                "dur": round(secs * 1e6),
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": fields,
+            }
+        )
+
+    def request(self, args, started, status, size, attempt):
+        secs = time.perf_counter() - started
+        endpoint = endpoint_name(args)
+        with self.lock:
+            self.requests[endpoint] += 1
+            self.retries[endpoint] += attempt > 0
+            self.failures[endpoint] += status is None or status >= 400
+            self.bytes[endpoint] += size
+            self.request_secs[endpoint] += secs
+            if self.events is not None:
+                self.event(endpoint, "request", started, secs, {"status": status, "bytes": size, "attempt": attempt})
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            secs = time.perf_counter() - started
+            with self.lock:
+                self.stages[name].append(secs)
+                if self.events is not None:
+                    self.event(name, "stage", started, secs, fields)
+
+    def record_stage(self, name, secs, **fields):
+        """Record a stage timed elsewhere, e.g. in a render worker process, as ending now."""
+        with self.lock:
+            self.stages[name].append(secs)
+            if self.events is not None:
+                self.event(name, "stage", time.perf_counter() - secs, secs, fields)
+
+    def stage_stats(self, name):
+        durations = sorted(self.stages[name])
+        histogram = Counter(bisect.bisect_left(LATENCY_BUCKETS_MS, secs * 1000) for secs in durations)
+        return {
+            "count": len(durations),
+            "total_secs": round(sum(durations), 4),
+            "p50_ms": round(percentile(durations, 0.5) * 1000, 2),
+            "p95_ms": round(percentile(durations, 0.95) * 1000, 2),
+            "max_ms": round(durations[-1] * 1000, 2),
+            "histogram_ms": {
+                (f"<={LATENCY_BUCKETS_MS[i]}" if i < len(LATENCY_BUCKETS_MS) else f">{LATENCY_BUCKETS_MS[-1]}"): count
+                for i, count in sorted(histogram.items())
+            },
+        }
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                "wall_secs": round(time.perf_counter() - self.origin, 4),
+                "requests": {
+                    endpoint: {
+                        "count": count,
+                        "retries": self.retries[endpoint],
+                        "failures": self.failures[endpoint],
+                        "bytes": self.bytes[endpoint],
+                        "secs": round(self.request_secs[endpoint], 4),
+                    }
+                    for endpoint, count in self.requests.most_common()
+                },
+                "stages": {name: self.stage_stats(name) for name in self.stages if self.stages[name]},
+            }
+
+    def summary(self):
+        snapshot = self.snapshot()
+        requests = snapshot["requests"]
+        lines = [
+            f"[requests] {sum(r['count'] for r in requests.values())} requests, "
+            f"{sum(r['retries'] for r in requests.values())} retries, "
+            f"{sum(r['bytes'] for r in requests.values()) / 1e6:.1f} MB in {snapshot['wall_secs']:.1f}s wall"
+        ]
+        for endpoint, stats in requests.items():
+            lines.append(
+                f"  {endpoint}: {stats['count']} requests, {stats['retries']} retries, "
+                f"{stats['bytes'] / 1e3:.0f} KB, {stats['secs']:.1f}s"
+            )
+        for name, stats in snapshot["stages"].items():
+            lines.append(
+                f"[stage] {name}: n={stats['count']} total {stats['total_secs']:.2f}s "
+                f"p50 {stats['p50_ms']:.1f}ms p95 {stats['p95_ms']:.1f}ms max {stats['max_ms']:.1f}ms"
+            )
+        return "\n".join(lines)
+
+    def write_trace(self, path, extra):
+        with self.lock:
+            events = list(self.events or [])
+        trace = {"traceEvents": events, "summary": {**self.snapshot(), **extra}}
+        Path(path).write_text(json.dumps(trace, indent=1) + "\n", encoding="utf-8")
+
+
+METRICS = Instrumentation()
+
+
+def parse_included_response(out):
+    match = re.search(r"\r?\n\r?\n", out)
+    head, body = (out[: match.start()], out[match.end() :]) if match else (out, "")
+    lines = head.splitlines()
+    status = None
+    if lines and lines[0].startswith("HTTP/"):
+        parts = lines[0].split()
+        if len(parts) >= 2 and parts[1].isdigit():
+            status = int(parts[1])
+    headers = {}
+    for line in lines[1:]:
+        name, sep, value = line.partition(":")
+        if sep:
+            headers[name.strip().lower()] = value.strip()
+    return status, headers, body
+
+
+def parse_gh_args(args):
+    """Split a ``gh api`` argument list into method, path, fields and headers."""
+    path = args[0]
+    method = None
+    fields = []
+    headers = {}
+    it = iter(args[1:])
+    for flag in it:
+        value = next(it)
+        if flag == "-X":
+            method = value
+        elif flag in ("-f", "-F"):
+            name, _, field = value.partition("=")
+            fields.append((name, field))
+        elif flag == "-H":
+            name, _, header = value.partition(":")
+            headers[name.strip()] = header.strip()
+        else:
+            raise ValueError(f"unsupported gh api flag: {flag}")
+    # Like gh, default to POST as soon as any field is given.
+    if method is None:
+        method = "POST" if fields else "GET"
+    return method, path, fields, headers
+
+
+class GhCliTransport:
+    """Runs every request as a separate ``gh api`` process."""
+
+    name = "gh"
+
+    def request(self, args, headers=None):
+        cmd = ["gh", "api", "--include", *args]
+        for name, value in (headers or {}).items():
+            cmd.extend(["-H", f"{name}: {value}"])
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        status, resp_headers, body = parse_included_response(proc.stdout)
+        # gh exits non-zero for every status above 299, including 304 Not Modified,
+        # and also for GraphQL responses that carry partial errors.
+        if status is not None and (status == 304 or 200 <= status < 300):
+            return status, resp_headers, body
+        raise ApiError(
+            f"command failed: {' '.join(cmd)}\nstdout:\n{proc.stdout}\nstderr:\n{proc.stderr}",
+            status,
+            resp_headers,
+        )
+
+
+class HttpTransport:
+    """Sends requests in-process over a pool of keep-alive connections.
+
+    Idle connections are kept in a LIFO queue so concurrent workers each reuse
+    a warm TLS session instead of paying a handshake per request.
+    """
+
+    name = "http"
+
+    def __init__(self, token, api_url=DEFAULT_API_URL):
+        parts = urlsplit(api_url)
+        self.scheme = parts.scheme
+        self.host = parts.netloc
+        self.base_path = parts.path.rstrip("/")
+        self.token = token
+        self.idle = queue.LifoQueue()
+
+    def connect(self):
+        if self.scheme == "http":
+            return http.client.HTTPConnection(self.host, timeout=HTTP_TIMEOUT_SECS)
+        return http.client.HTTPSConnection(self.host, timeout=HTTP_TIMEOUT_SECS)
+
+    def acquire(self):
+        try:
+            return self.idle.get_nowait(), True
+        except queue.Empty:
+            return self.connect(), False
+
+    def send(self, host, method, url, payload, headers):
+        if host != self.host:
+            # Redirected to another host: a one-off connection outside the pool.
+            conn_class = http.client.HTTPConnection if self.scheme == "http" else http.client.HTTPSConnection
+            conn = conn_class(host, timeout=HTTP_TIMEOUT_SECS)
+            try:
+                conn.request(method, url, body=payload, headers=headers)
+                resp = conn.getresponse()
+                return resp, resp.read()
+            finally:
+                conn.close()
+        conn, reused = self.acquire()
+        try:
+            conn.request(method, url, body=payload, headers=headers)
+            resp = conn.getresponse()
+            raw = resp.read()
+        except (http.client.HTTPException, OSError):
+            conn.close()
+            if not reused:
+                raise
+            # The server may have closed an idle keep-alive connection; retry once on a fresh one.
+            conn = self.connect()
+            try:
+                conn.request(method, url, body=payload, headers=headers)
+                resp = conn.getresponse()
+                raw = resp.read()
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                raise
+        if resp.will_close:
+            conn.close()
+        else:
+            self.idle.put(conn)
+        return resp, raw
+
+    def request(self, args, headers=None):
+        method, path, fields, extra_headers = parse_gh_args(args)
+        base_path = self.base_path
+        if path == "graphql" and base_path.endswith("/v3"):
+            # GitHub Enterprise serves GraphQL at /api/graphql next to /api/v3.
+            base_path = base_path[: -len("/v3")]
+        url = f"{base_path}/{path.lstrip('/')}"
+        payload = None
+        if fields and method == "GET":
+            url += "?" + urlencode(fields)
+        elif fields:
+            payload = json.dumps(dict(fields)).encode("utf-8")
+        req_headers = {
+            "Accept": "application/vnd.github+json",
+            "Accept-Encoding": "gzip",
+            "Authorization": f"Bearer {self.token}",
+            "User-Agent": "generate-tidb-issue-experiences",
+            "X-GitHub-Api-Version": "2022-11-28",
+            **extra_headers,
+            **(headers or {}),
+        }
+        if payload is not None:
+            req_headers["Content-Type"] = "application/json"
+        host = self.host
+        for _ in range(MAX_REDIRECTS + 1):
+            resp, raw = self.send(host, method, url, payload, req_headers)
+            location = resp.getheader("Location")
+            if resp.status not in REDIRECT_STATUSES or not location:
+                break
+            # Follow renamed repositories and moved issues the way gh does: a
+            # 301/302 turns a POST into a GET, and credentials never leave the host.
+            target = urlsplit(location)
+            if target.netloc and target.netloc != host:
+                host = target.netloc
+                req_headers.pop("Authorization", None)
+            url = target.path + (f"?{target.query}" if target.query else "")
+            if resp.status in (301, 302) and method == "POST":
+                method, payload = "GET", None
+                req_headers.pop("Content-Type", None)
+        else:
+            raise ApiError(f"too many redirects: {method} {url}", resp.status, {})
+
+        resp_headers = {name.lower(): value for name, value in resp.getheaders()}
+        if resp_headers.get("content-encoding") == "gzip":
+            raw = gzip.decompress(raw)
+        body = raw.decode("utf-8")
+        if resp.status == 304 or 200 <= resp.status < 300:
+            return resp.status, resp_headers, body
+        raise ApiError(f"request failed: {method} {url}\nstatus: {resp.status}\nbody:\n{body}", resp.status, resp_headers)
+
+
+def resolve_token(api_url):
+    """Find a token the same way gh does: environment first, then gh's own credential store."""
+    for name in ("GH_TOKEN", "GITHUB_TOKEN"):
+        if os.environ.get(name):
+            return os.environ[name]
+    if shutil.which("gh") is None:
+        return None
+    cmd = ["gh", "auth", "token"]
+    host = urlsplit(api_url).netloc
+    if host != "api.github.com":
+        cmd.extend(["--hostname", host])
+    proc = subprocess.run(cmd, capture_output=True, text=True)
+    token = proc.stdout.strip()
+    return token if proc.returncode == 0 and token else None
+
+
+def make_transport(kind, api_url):
+    if kind == "gh":
+        return GhCliTransport()
+    token = resolve_token(api_url)
+    if token:
+        return HttpTransport(token, api_url)
+    if kind == "http":
+        raise RuntimeError("the http transport needs a token in GH_TOKEN/GITHUB_TOKEN or from 'gh auth login'")
+    return GhCliTransport()
+
+
+class RecordingTransport:
+    """Passes requests to another transport and saves each response as a fixture.
+
+    Fixtures are keyed like the response cache, by a hash of the ``gh api``
+    arguments. Conditional headers are dropped so every fixture holds a full
+    body, and error responses are saved too so a replay fails the same way.
+    """
+
+    def __init__(self, inner, root):
+        self.inner = inner
+        self.name = f"record+{inner.name}"
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.started_at = datetime.now(timezone.utc).replace(microsecond=0)
+        self.save_meta()
+
+    def save_meta(self):
+        meta = {"recorded_at": self.started_at.strftime("%Y-%m-%dT%H:%M:%SZ")}
+        (self.root / FIXTURE_META_NAME).write_text(json.dumps(meta, indent=2) + "\n", encoding="utf-8")
+
+    def request(self, args, headers=None):
+        fixture = {"args": args}
+        try:
+            status, resp_headers, body = self.inner.request(args)
+            fixture.update(status=status, headers=resp_headers, body=body)
+            return status, resp_headers, body
+        except ApiError as exc:
+            fixture.update(status=exc.status, headers=exc.headers, error=str(exc))
+            raise
+        finally:
+            if "status" in fixture:
+                path = fixture_path(self.root, args)
+                path.parent.mkdir(parents=True, exist_ok=True)
+                atomic_write_text(path, json.dumps(fixture))
+
+
+class ReplayTransport:
+    """Answers requests from fixtures saved by RecordingTransport.
+
+    Rate-limit headers are stripped so the scheduler never waits. A request
+    that was not recorded fails like a missing resource.
+    """
+
+    name = "replay"
+
+    def __init__(self, root):
+        self.root = Path(root)
+        meta = json.loads((self.root / FIXTURE_META_NAME).read_text(encoding="utf-8"))
+        self.recorded_at = parse_iso8601(meta["recorded_at"])
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.bytes = 0
+
+    def request(self, args, headers=None):
+        try:
+            fixture = json.loads(fixture_path(self.root, args).read_text(encoding="utf-8"))
+        except OSError:
+            raise ApiError(f"no recorded response in {self.root} for: gh api {' '.join(args)}", 404) from None
+        resp_headers = {
+            name: value
+            for name, value in fixture["headers"].items()
+            if not name.startswith("x-ratelimit-") and name != "retry-after"
+        }
+        with self.lock:
+            self.requests += 1
+            self.bytes += len(fixture.get("body", "").encode("utf-8"))
+        if "error" in fixture:
+            raise ApiError(fixture["error"], fixture["status"], resp_headers)
+        return fixture["status"], resp_headers, fixture["body"]
+
+
+TRANSPORT = GhCliTransport()
+# Pinned "now" while replaying fixtures so date-relative search windows match the recording.
+CLOCK = None
+
+
+def utc_now():
+    return CLOCK or datetime.now(timezone.utc)
+
+
+def send_request(args, headers, attempt):
+    started = time.perf_counter()
+    status, size = None, 0
+    try:
+        status, resp_headers, body = TRANSPORT.request(args, headers)
+        size = len(body.encode("utf-8"))
+        return status, resp_headers, body
+    except ApiError as exc:
+        status = exc.status
+        raise
+    finally:
+        METRICS.request(args, started, status, size, attempt)
 
 
 def gh_json(args):
-    last_err = None
-    for _ in range(MAX_RETRIES):
+    cache = RESPONSE_CACHE
+    entry = cache.load(args) if cache else None
+    if entry and cache.is_fresh(entry):
+        cache.record("fresh")
+        return json.loads(entry["body"])
+
+    resource = rate_limit_resource(args)
+    for attempt in range(MAX_RETRIES):
+        SCHEDULER.acquire(resource)
         try:
-            out = run(["gh", "api", *args])
-            return json.loads(out)
+            headers = cache.conditional_headers(entry) if cache else {}
+            status, resp_headers, body = send_request(args, headers, attempt)
+            SCHEDULER.observe(resource, resp_headers)
+            if status == 304 and entry:
+                cache.revalidated(args, entry, resp_headers)
+                cache.record("revalidated")
+                return json.loads(entry["body"])
+            data = json.loads(body)
+            if cache:
+                cache.store(args, resp_headers, body)
+                cache.record("miss")
+            return data
         except Exception as exc:
-            last_err = exc
-            time.sleep(0.5)
-    raise last_err
+            if isinstance(exc, ApiError):
+                SCHEDULER.observe(resource, exc.headers)
+            if not is_retryable(exc):
+                SCHEDULER.record_permanent_failure()
+                raise
+            if attempt == MAX_RETRIES - 1:
+                raise
+            SCHEDULER.backoff(attempt)
 
 
-def fetch_search_issues(query):
-    issues = []
+def search_page(query, page, sort=None):
+    args = [
+        "search/issues",
+        "-X",
+        "GET",
+        "-f",
+        f"q={query}",
+        "-f",
+        "per_page=100",
+        "-f",
+        f"page={page}",
+    ]
+    if sort:
+        args.extend(["-f", f"sort={sort}", "-f", "order=desc"])
+    with METRICS.stage("search", page=page):
+        return gh_json(args)
+
+
+def iter_search_pages(query, sort=None, first_page=None):
     page = 1
     while True:
-        data = gh_json(
-            [
-                "search/issues",
-                "-X",
-                "GET",
-                "-f",
-                f"q={query}",
-                "-f",
-                "per_page=100",
-                "-f",
-                f"page={page}",
-            ]
-        )
+        data = first_page if page == 1 and first_page is not None else search_page(query, page, sort)
         items = data.get("items", [])
         if not items:
             break
-        issues.extend(items)
+        yield items
         if len(items) < 100:
             break
         page += 1
-        time.sleep(SLEEP_SECS)
-    return issues
+
+
+CREATED_QUALIFIER = re.compile(r"(?<!\S)created:(\S+)")
+
+
+def parse_search_time(text, end_of_day=False):
+    if "T" in text:
+        return parse_iso8601(text)
+    day = datetime.strptime(text, "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return day + timedelta(days=1, seconds=-1) if end_of_day else day
+
+
+def created_range(query):
+    """Return ``(query without its created: qualifier, start, end)`` as inclusive UTC datetimes."""
+    now = utc_now().replace(microsecond=0)
+    match = CREATED_QUALIFIER.search(query)
+    if not match:
+        return query, SEARCH_EPOCH, now
+    base = f"{query[: match.start()].rstrip()} {query[match.end() :].lstrip()}".strip()
+    value = match.group(1)
+    second = timedelta(seconds=1)
+    if ".." in value:
+        low, high = value.split("..", 1)
+        start = SEARCH_EPOCH if low in ("", "*") else parse_search_time(low)
+        end = now if high in ("", "*") else parse_search_time(high, end_of_day=True)
+    elif value.startswith(">="):
+        start, end = parse_search_time(value[2:]), now
+    elif value.startswith(">"):
+        start, end = parse_search_time(value[1:], end_of_day=True) + second, now
+    elif value.startswith("<="):
+        start, end = SEARCH_EPOCH, parse_search_time(value[2:], end_of_day=True)
+    elif value.startswith("<"):
+        start, end = SEARCH_EPOCH, parse_search_time(value[1:]) - second
+    else:
+        start, end = parse_search_time(value), parse_search_time(value, end_of_day=True)
+    return base, start, end
+
+
+def created_window_query(base, start, end):
+    fmt = "%Y-%m-%dT%H:%M:%SZ"
+    return f"{base} created:{start.astimezone(timezone.utc):{fmt}}..{end.astimezone(timezone.utc):{fmt}}"
+
+
+def split_window(low, high):
+    mid = (low + (high - low) / 2).replace(microsecond=0)
+    return [(low, mid), (mid + timedelta(seconds=1), high)]
+
+
+def plan_search_windows(query, sort, workers):
+    """Split the created: range of ``query`` into windows under the search result cap.
+
+    The caller already knows the whole range is over the cap, so it is
+    halved before the first probe. Each round probes the pending windows in
+    parallel. A window over the cap is halved and probed again; the rest are
+    kept with their first page so it is not fetched twice. Returns
+    ``[(window query, first page)]``, newest window first.
+    """
+    base, start, end = created_range(query)
+    windows = []
+    pending = split_window(start, end)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending:
+            probes = list(
+                executor.map(lambda window: (window, search_page(created_window_query(base, *window), 1, sort)), pending)
+            )
+            pending = []
+            for (low, high), data in probes:
+                total = data.get("total_count", 0)
+                if total > SEARCH_RESULT_CAP and high - low >= timedelta(seconds=2):
+                    pending.extend(split_window(low, high))
+                elif total:
+                    if total > SEARCH_RESULT_CAP:
+                        print(
+                            f"[search] window {created_window_query(base, low, high)} still has {total} results; "
+                            f"only the first {SEARCH_RESULT_CAP} are reachable",
+                            file=sys.stderr,
+                            flush=True,
+                        )
+                    windows.append((low, created_window_query(base, low, high), data))
+    windows.sort(key=lambda window: window[0], reverse=True)
+    return [(window_query, data) for _, window_query, data in windows]
+
+
+def iter_sharded_search_pages(query, sort=None, workers=1):
+    """Yield search result pages for ``query``, sharding it by creation date past the 1000-result cap.
+
+    The first page of each window and its result count come from planning,
+    so every remaining page is known up front. Pages are fetched in parallel
+    with at most ``workers`` in flight and yielded in order, newest window
+    first, as they arrive. Issues are deduplicated by number in case results
+    shift between pages.
+    """
+    first_page = search_page(query, 1, sort)
+    total = first_page.get("total_count", 0)
+    if total <= SEARCH_RESULT_CAP:
+        yield from iter_search_pages(query, sort, first_page)
+        return
+
+    windows = plan_search_windows(query, sort, workers)
+    print(f"[search] {total} results split into {len(windows)} created: windows", flush=True)
+
+    def pages():
+        for window_query, first_page in windows:
+            yield window_query, 1, first_page
+            reachable = min(first_page.get("total_count", 0), SEARCH_RESULT_CAP)
+            for page in range(2, (reachable + 99) // 100 + 1):
+                yield window_query, page, None
+
+    def fetch(item):
+        window_query, page, data = item
+        return data if data is not None else search_page(window_query, page, sort)
+
+    seen = set()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for data in ordered_map(executor, fetch, pages(), workers):
+            fresh = [item for item in data.get("items", []) if item["number"] not in seen]
+            seen.update(item["number"] for item in fresh)
+            if fresh:
+                yield fresh
+
+
+def fetch_search_issues(query):
+    return [item for items in iter_search_pages(query) for item in items]
 
 
 def fetch_timeline(repo, issue_number):
@@ -111,7 +1108,6 @@ def fetch_timeline(repo, issue_number):
         if len(batch) < 100:
             break
         page += 1
-        time.sleep(SLEEP_SECS)
     return items
 
 
@@ -119,10 +1115,10 @@ def fetch_pr(repo, pr_number):
     return gh_json([f"repos/{repo}/pulls/{pr_number}"])
 
 
-def fetch_pr_files(repo, pr_number):
+def fetch_pr_files(repo, pr_number, max_pages=None):
     files = []
     page = 1
-    while True:
+    while max_pages is None or page <= max_pages:
         batch = gh_json(
             [
                 f"repos/{repo}/pulls/{pr_number}/files",
@@ -140,10 +1136,263 @@ def fetch_pr_files(repo, pr_number):
         if len(batch) < 100:
             break
         page += 1
-        time.sleep(SLEEP_SECS)
     return files
 
 
+GRAPHQL_TIMELINE_FIELDS = """
+timelineItems(first: 100, after: %s, itemTypes: [CROSS_REFERENCED_EVENT, ISSUE_COMMENT]) {
+  pageInfo { hasNextPage endCursor }
+  nodes {
+    __typename
+    ... on CrossReferencedEvent {
+      source { __typename ... on Issue { number } ... on PullRequest { number url } }
+    }
+    ... on IssueComment { body }
+  }
+}
+"""
+
+GRAPHQL_PR_FILES_FIELDS = """
+files(first: 100, after: %s) {
+  pageInfo { hasNextPage endCursor }
+  nodes { path }
+}
+"""
+
+GRAPHQL_PR_FIELDS = """
+number
+title
+url
+state
+mergedAt
+createdAt
+updatedAt
+body
+changedFiles
+""" + GRAPHQL_PR_FILES_FIELDS
+
+
+def gh_graphql(query):
+    result = gh_json(["graphql", "-f", f"query={query}"])
+    # Unknown issue or PR numbers come back as null nodes with NOT_FOUND errors;
+    # everything else (rate limits, bad queries) fails the whole call.
+    errors = [err for err in result.get("errors") or [] if err.get("type") != "NOT_FOUND"]
+    if errors:
+        raise RuntimeError(f"graphql query failed: {json.dumps(errors)}")
+    return result["data"]
+
+
+def graphql_cursor(cursor):
+    return json.dumps(cursor) if cursor else "null"
+
+
+def graphql_timeline_item(node):
+    """Convert a GraphQL timeline node into the REST timeline event shape."""
+    if node["__typename"] == "IssueComment":
+        return {"event": "commented", "body": node.get("body") or ""}
+    source = node.get("source") or {}
+    issue = {"number": source.get("number")}
+    if source.get("__typename") == "PullRequest":
+        issue["pull_request"] = {"html_url": source.get("url")}
+    return {"event": "cross-referenced", "source": {"issue": issue}}
+
+
+def graphql_pr(node):
+    """Convert a GraphQL pull request node into the REST pull request shape."""
+    return {
+        "number": node["number"],
+        "title": node["title"],
+        "html_url": node["url"],
+        "state": "open" if node["state"] == "OPEN" else "closed",
+        "merged_at": node.get("mergedAt"),
+        "created_at": node.get("createdAt"),
+        "updated_at": node.get("updatedAt"),
+        "body": node.get("body") or "",
+        "changed_files": node.get("changedFiles"),
+    }
+
+
+class RestSource:
+    """Fetches timelines and PRs with one REST call per page."""
+
+    def __init__(self, repo, file_pages=None):
+        self.repo = repo
+        self.file_pages = file_pages
+
+    def plan(self, issue_numbers):
+        pass
+
+    def timeline(self, issue_number):
+        return fetch_timeline(self.repo, issue_number)
+
+    def pr(self, pr_number):
+        return fetch_pr(self.repo, pr_number)
+
+    def pr_files(self, pr_number):
+        return fetch_pr_files(self.repo, pr_number, self.file_pages)
+
+
+class PullRequestStore:
+    """Run-wide, single-flight cache of PR details and file lists in front of a source.
+
+    Cherry-picks and umbrella fixes show up in the timelines of several
+    issues. The first lookup of a PR fetches it and every later or
+    concurrent lookup waits for that same result, including a failure, so
+    each PR is requested once per run.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.stats = Counter()
+
+    def plan(self, issue_numbers):
+        self.source.plan(issue_numbers)
+
+    def timeline(self, issue_number):
+        with METRICS.stage("timeline", issue=issue_number):
+            return self.source.timeline(issue_number)
+
+    def pr(self, pr_number):
+        with METRICS.stage("pr", pr=pr_number):
+            return self.load("pr", self.source.pr, pr_number)
+
+    def pr_files(self, pr_number):
+        with METRICS.stage("files", pr=pr_number):
+            return self.load("files", self.source.pr_files, pr_number)
+
+    def load(self, kind, fetch, pr_number):
+        with self.lock:
+            future = self.futures.get((kind, pr_number))
+            owner = future is None
+            if owner:
+                future = Future()
+                self.futures[(kind, pr_number)] = future
+            self.stats[f"{kind}_fetched" if owner else f"{kind}_reused"] += 1
+        if owner:
+            try:
+                future.set_result(fetch(pr_number))
+            except Exception as exc:
+                future.set_exception(exc)
+        return future.result()
+
+    def summary(self):
+        return (
+            f"[prs] fetched {self.stats['pr_fetched']} PRs and {self.stats['files_fetched']} file lists once each; "
+            f"saved {self.stats['pr_reused']} PR and {self.stats['files_reused']} file list fetches"
+        )
+
+
+class GraphQLSource:
+    """Fetches timelines, PR metadata and changed files in batched GraphQL queries.
+
+    Issues passed to ``plan`` are split into batches. The first lookup that
+    touches a batch loads the timelines of all its issues with one query, then
+    every PR referenced from those timelines with one query per
+    ``batch_size`` PRs. Timelines or file lists longer than one page are
+    completed with follow-up queries for just that node, up to ``file_pages``
+    pages of files. Results are converted to the REST shapes, so the rest of
+    the pipeline is unchanged.
+    """
+
+    def __init__(self, repo, batch_size=DEFAULT_GRAPHQL_BATCH_SIZE, file_pages=None):
+        self.owner, self.name = repo.split("/", 1)
+        self.batch_size = batch_size
+        self.file_pages = file_pages
+        self.lock = threading.Lock()
+        self.batch_of = {}
+        self.batches = []
+        self.timelines = {}
+        self.prs = {}
+        self.queries = 0
+
+    def plan(self, issue_numbers):
+        with self.lock:
+            for start in range(0, len(issue_numbers), self.batch_size):
+                batch = {"issues": issue_numbers[start : start + self.batch_size], "lock": threading.Lock(), "loaded": False}
+                for number in batch["issues"]:
+                    self.batch_of[number] = batch
+                self.batches.append(batch)
+
+    def query(self, body):
+        with self.lock:
+            self.queries += 1
+        owner = json.dumps(self.owner)
+        name = json.dumps(self.name)
+        return gh_graphql(f"query {{ repository(owner: {owner}, name: {name}) {{ {body} }} }}")["repository"]
+
+    def timeline(self, issue_number):
+        if issue_number not in self.batch_of:
+            self.plan([issue_number])
+        batch = self.batch_of[issue_number]
+        with batch["lock"]:
+            if not batch["loaded"]:
+                self.load_batch(batch["issues"])
+                batch["loaded"] = True
+        return self.timelines[issue_number]
+
+    def pr(self, pr_number):
+        return self.load_pr(pr_number)[0]
+
+    def pr_files(self, pr_number):
+        return self.load_pr(pr_number)[1]
+
+    def load_pr(self, pr_number):
+        if pr_number not in self.prs:
+            self.load_prs([pr_number])
+        loaded = self.prs[pr_number]
+        if loaded is None:
+            raise RuntimeError(f"pull request #{pr_number} was not found in {self.owner}/{self.name}")
+        return loaded
+
+    def load_batch(self, issue_numbers):
+        fields = GRAPHQL_TIMELINE_FIELDS % graphql_cursor(None)
+        repo = self.query(" ".join(f"i{n}: issue(number: {n}) {{ {fields} }}" for n in issue_numbers))
+        pr_numbers = []
+        for number in issue_numbers:
+            node = repo.get(f"i{number}")
+            if node is None:
+                raise RuntimeError(f"issue #{number} was not found in {self.owner}/{self.name}")
+            items = self.collect_pages(
+                node["timelineItems"],
+                lambda cursor, number=number: self.query(
+                    f"issue(number: {number}) {{ {GRAPHQL_TIMELINE_FIELDS % graphql_cursor(cursor)} }}"
+                )["issue"]["timelineItems"],
+            )
+            self.timelines[number] = [graphql_timeline_item(item) for item in items]
+            pr_numbers.extend(parse_pr_numbers_from_timeline(self.timelines[number])[0])
+        self.load_prs([number for number in dict.fromkeys(pr_numbers) if number not in self.prs])
+
+    def load_prs(self, pr_numbers):
+        fields = GRAPHQL_PR_FIELDS % graphql_cursor(None)
+        for start in range(0, len(pr_numbers), self.batch_size):
+            chunk = pr_numbers[start : start + self.batch_size]
+            repo = self.query(" ".join(f"p{n}: pullRequest(number: {n}) {{ {fields} }}" for n in chunk))
+            for number in chunk:
+                node = repo.get(f"p{number}")
+                if node is None:
+                    self.prs[number] = None
+                    continue
+                paths = self.collect_pages(
+                    node["files"],
+                    lambda cursor, number=number: self.query(
+                        f"pullRequest(number: {number}) {{ {GRAPHQL_PR_FILES_FIELDS % graphql_cursor(cursor)} }}"
+                    )["pullRequest"]["files"],
+                    self.file_pages,
+                )
+                self.prs[number] = (graphql_pr(node), [{"filename": item["path"]} for item in paths])
+
+    def collect_pages(self, connection, fetch_next, max_pages=None):
+        nodes = list(connection["nodes"])
+        pages = 1
+        while connection["pageInfo"]["hasNextPage"] and (max_pages is None or pages < max_pages):
+            connection = fetch_next(connection["pageInfo"]["endCursor"])
+            nodes.extend(connection["nodes"])
+            pages += 1
+        return nodes
+
+
 def slugify(text):
     text = text.lower()
     text = re.sub(r"[^a-z0-9]+", "-", text)
@@ -163,17 +1412,29 @@ def label_names(labels):
     return sorted(label["name"] for label in labels)
 
 
+# Ordered (trigger, pattern, replacement) passes applied by sanitize_text.
+# The order matters: URLs are stripped before images, so an image whose target
+# was a URL is left as "![alt]()" rather than removed. A pass is skipped when
+# its trigger substring is absent, which is a necessary condition for a match.
+SANITIZE_PASSES = [
+    ("<!", re.compile(r"<![\s\S]*?-->"), ""),
+    ("https://github.com/", re.compile(r"https://github\.com/[^\s)]+"), ""),
+    ("://", re.compile(r"https?://[^\s)]+"), ""),
+    ("![", re.compile(r"!\[[^\]]*\]\([^)]+\)"), ""),
+    ("<img", re.compile(r"<img[^>]*>"), ""),
+    ("```", re.compile(r"`{3}[\s\S]*?`{3}"), ""),
+    ("`", re.compile(r"`[^`]*`"), ""),
+    ("#", re.compile(r"^#+\s*", re.M), ""),
+    ("\n\n\n", re.compile(r"\n{3,}"), "\n\n"),
+]
+
+
+@functools.lru_cache(maxsize=1024)
 def sanitize_text(text):
     text = text.replace("\r\n", "\n")
-    text = re.sub(r"<![\s\S]*?-->", "", text)
-    text = re.sub(r"https://github\.com/[^\s)]+", "", text)
-    text = re.sub(r"https?://[^\s)]+", "", text)
-    text = re.sub(r"!\[[^\]]*\]\([^)]+\)", "", text)
-    text = re.sub(r"<img[^>]*>", "", text)
-    text = re.sub(r"`{3}[\s\S]*?`{3}", "", text)
-    text = re.sub(r"`[^`]*`", "", text)
-    text = re.sub(r"^#+\s*", "", text, flags=re.M)
-    text = re.sub(r"\n{3,}", "\n\n", text)
+    for trigger, pattern, replacement in SANITIZE_PASSES:
+        if trigger in text:
+            text = pattern.sub(replacement, text)
     return text.strip()
 
 
@@ -183,16 +1444,58 @@ def parse_iso8601(ts):
     return datetime.fromisoformat(ts.replace("Z", "+00:00"))
 
 
+SECTION_BOUNDARY = re.compile(r"\n(?:### |## )")
+LEADING_WHITESPACE = re.compile(r"\s*")
+
+
+class SectionIndex:
+    """Section layout of one markdown body, scanned once.
+
+    A section starts after the first occurrence of its heading text (and any
+    whitespace after it) and runs to the next ``## ``/``### `` heading line
+    or the end of the body. All heading-line offsets are collected in one
+    pass, so each lookup is a substring search plus a bisect, and results
+    are memoized per heading.
+    """
+
+    def __init__(self, body):
+        self.body = body
+        self.boundaries = [match.start() for match in SECTION_BOUNDARY.finditer(body)]
+        self.sections = {}
+        self.full_text = None
+
+    def section(self, heading):
+        if heading not in self.sections:
+            self.sections[heading] = self.locate(heading)
+        return self.sections[heading]
+
+    def locate(self, heading):
+        pos = self.body.find(heading)
+        if pos < 0:
+            return ""
+        start = LEADING_WHITESPACE.match(self.body, pos + len(heading)).end()
+        idx = bisect.bisect_left(self.boundaries, start)
+        end = self.boundaries[idx] if idx < len(self.boundaries) else len(self.body)
+        return sanitize_text(self.body[start:end])
+
+    def sanitized(self):
+        if self.full_text is None:
+            self.full_text = sanitize_text(self.body)
+        return self.full_text
+
+
+@functools.lru_cache(maxsize=256)
+def section_index(body):
+    return SectionIndex(body)
+
+
 def extract_section(body, heading):
-    pattern = re.compile(rf"{re.escape(heading)}\s*(.*?)(?=\n### |\n## |\Z)", re.S)
-    match = pattern.search(body)
-    if match:
-        return sanitize_text(match.group(1))
-    return ""
+    return section_index(body).section(heading)
 
 
 def extract_phenomenon(body):
     body = body or ""
+    index = section_index(body)
     for heading in [
         "### 3. What did you see instead (Required)",
         "### 1. Minimal reproduce step (Required)",
@@ -200,7 +1503,7 @@ def extract_phenomenon(body):
         "### Problem Summary",
         "## Problem Summary",
     ]:
-        section = extract_section(body, heading)
+        section = index.section(heading)
         if section:
             lines = [ln.strip("- ").strip() for ln in section.splitlines() if ln.strip()]
             lines = [ln for ln in lines if not ln.startswith("<!--")]
@@ -219,7 +1522,7 @@ def extract_phenomenon(body):
                 candidate = " ".join(lines[:4]).strip()
                 if len(candidate) >= 20:
                     return candidate[:1200]
-    fallback = sanitize_text(body)
+    fallback = index.sanitized()
     paragraphs = [p.strip() for p in re.split(r"\n\s*\n", fallback) if p.strip()]
     bad_prefixes = (
         "Bug Report",
@@ -275,25 +1578,62 @@ def parse_pr_numbers_from_timeline(timeline):
     return ordered, set(explicit)
 
 
+class ModuleBucketer:
+    """Maps changed file paths to module buckets by longest matching prefix.
+
+    Rules are compiled into a character trie, so classifying a path costs
+    one step per character no matter how many rules there are. Paths
+    matching no rule fall back to their first ``depth`` components.
+    """
+
+    def __init__(self, rules=(), depth=DEFAULT_BUCKET_DEPTH):
+        self.depth = depth
+        self.trie = {}
+        for prefix, bucket in rules:
+            node = self.trie
+            for char in prefix:
+                node = node.setdefault(char, {})
+            node[None] = bucket
+        digest_input = json.dumps({"depth": depth, "rules": sorted(rules)}, sort_keys=True)
+        self.digest = hashlib.sha256(digest_input.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def load(cls, path):
+        try:
+            config = json.loads(Path(path).read_text(encoding="utf-8"))
+            rules = [(rule["prefix"], rule.get("bucket") or rule["prefix"].rstrip("/")) for rule in config.get("rules", [])]
+            depth = int(config.get("depth", DEFAULT_BUCKET_DEPTH))
+        except (OSError, ValueError, TypeError, KeyError) as exc:
+            raise RuntimeError(f"invalid module rules file {path}: {exc}") from exc
+        return cls(rules, depth)
+
+    @classmethod
+    def for_repo(cls, repo, path=None):
+        if path is None:
+            default = MODULE_RULES_DIR / f"{repo}.json"
+            if not default.is_file():
+                return cls()
+            path = default
+        return cls.load(path)
+
+    def bucket(self, path):
+        node = self.trie
+        match = None
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            match = node.get(None, match)
+        if match is not None:
+            return match
+        return "/".join(path.split("/")[: self.depth])
+
+
+MODULE_BUCKETER = ModuleBucketer.for_repo(REPO)
+
+
 def module_bucket(path):
-    if path.startswith("pkg/planner/core"):
-        return "pkg/planner/core"
-    if path.startswith("pkg/planner/"):
-        return "pkg/planner"
-    if path.startswith("pkg/statistics"):
-        return "pkg/statistics"
-    if path.startswith("pkg/executor"):
-        return "pkg/executor"
-    if path.startswith("pkg/parser"):
-        return "pkg/parser"
-    if path.startswith("pkg/session"):
-        return "pkg/session"
-    if path.startswith("pkg/infoschema"):
-        return "pkg/infoschema"
-    parts = path.split("/")
-    if len(parts) >= 2:
-        return "/".join(parts[:2])
-    return parts[0]
+    return MODULE_BUCKETER.bucket(path)
 
 
 def summarize_files(files):
@@ -306,7 +1646,7 @@ def summarize_files(files):
 def summarize_pr_body(body):
     if not body:
         return ""
-    body = sanitize_text(body)
+    body = section_index(body).sanitized()
     lines = [ln.strip("- ").strip() for ln in body.splitlines() if ln.strip()]
     useful = []
     for ln in lines:
@@ -359,7 +1699,11 @@ def render_issue(issue, pr_details):
                 lines.append(f"  Merged At: {pr['merged_at']}")
             else:
                 lines.append("  Merged At: not merged")
-            lines.append(f"  Changed Files Count: {len(pr['files'])}")
+            lines.append(f"  Changed Files Count: {pr['changed_files']}")
+            if pr.get("files_sampled"):
+                lines.append(
+                    f"  File Listing: sampled the first {len(pr['files'])} files; Main Modules are estimated from the sample."
+                )
             if pr["top_buckets"]:
                 lines.append(f"  Main Modules: {', '.join(pr['top_buckets'])}")
             if pr["sample_files"]:
@@ -385,97 +1729,633 @@ def render_issue(issue, pr_details):
     return "\n".join(lines) + "\n"
 
 
-def main():
-    args = parse_args()
-    out_dir = Path(args.out_dir)
-    out_dir.mkdir(parents=True, exist_ok=True)
+def fetch_issue_prs(source, repo, issue):
+    issue_number = issue["number"]
+    timeline = source.timeline(issue_number)
+    pr_numbers, explicit_prs = parse_pr_numbers_from_timeline(timeline)
+    issue_created_at = parse_iso8601(issue.get("created_at"))
+    prs = []
+
+    for pr_number in pr_numbers:
+        try:
+            pr = source.pr(pr_number)
+            body = pr.get("body", "") or ""
+            pr_created_at = parse_iso8601(pr.get("created_at"))
+            relation = "timeline_ref"
+
+            if pr_number in explicit_prs:
+                relation = "explicit_fix"
+            elif re.search(rf"\b(?:fix|fixed|close|closed|resolve|resolved)\s+#?{issue_number}\b", body, re.I):
+                relation = "explicit_fix"
+            elif re.search(rf"\bIssue Number:\s*(?:fix|fixed|close|closed|ref)\s+#?{issue_number}\b", body, re.I):
+                relation = "explicit_fix"
+
+            if relation != "explicit_fix" and issue_created_at and pr_created_at:
+                if pr_created_at < issue_created_at - timedelta(days=14):
+                    continue
+
+            prs.append(
+                {
+                    "number": pr["number"],
+                    "title": pr["title"],
+                    "html_url": pr["html_url"],
+                    "state": pr["state"],
+                    "merged_at": pr.get("merged_at"),
+                    "updated_at": pr.get("updated_at"),
+                    "changed_files": pr.get("changed_files"),
+                    "files": source.pr_files(pr_number),
+                    "body": body,
+                    "relation": relation,
+                }
+            )
+        except Exception as exc:
+            prs.append(
+                {
+                    "number": pr_number,
+                    "title": f"Failed to fetch PR details: {exc}",
+                    "html_url": f"https://github.com/{repo}/pull/{pr_number}",
+                    "state": "unknown",
+                    "merged_at": None,
+                    "updated_at": None,
+                    "changed_files": 0,
+                    "files": [],
+                    "body": "",
+                    "relation": "timeline_ref",
+                }
+            )
+    return prs
+
+
+def summarize_prs(raw_prs):
+    """Turn fetched PRs into the rendered PR details: module buckets, sample files and body summary."""
+    prs = []
+    for raw in raw_prs:
+        pr = {key: value for key, value in raw.items() if key != "body"}
+        # Without --full-file-lists only the first pages are fetched; the PR's
+        # changed_files count tells whether that was the whole listing.
+        pr["changed_files"] = max(raw["changed_files"] or 0, len(raw["files"]))
+        pr["files_sampled"] = pr["changed_files"] > len(raw["files"])
+        pr["top_buckets"], pr["sample_files"] = summarize_files(raw["files"])
+        pr["body_summary"] = summarize_pr_body(raw["body"])
+        prs.append(pr)
+    return prs
+
+
+def init_render_worker(bucketer):
+    global MODULE_BUCKETER
+    MODULE_BUCKETER = bucketer
 
-    issues = fetch_search_issues(args.query)
-    issues.sort(key=lambda item: item["number"], reverse=True)
 
-    index_lines = [
+def render_job(job):
+    """CPU side of one issue, run in a render worker: ``(markdown, JSONL record or None, seconds)``.
+
+    Issues reused by --incremental (``raw_prs`` is None) have nothing to render.
+    """
+    issue, raw_prs, filename, export = job
+    if raw_prs is None:
+        return None
+    started = time.perf_counter()
+    prs = summarize_prs(raw_prs)
+    rendered = render_issue(issue, prs)
+    record = issue_record(issue, prs, filename) if export else None
+    return rendered, record, time.perf_counter() - started
+
+
+def render_chunk(jobs):
+    return [render_job(job) for job in jobs]
+
+
+def chunked(items, size):
+    items = iter(items)
+    while True:
+        chunk = list(itertools.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def content_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest(out_dir, settings):
+    """Load the incremental manifest; different rendering ``settings`` invalidate every stored issue."""
+    fresh = {"version": MANIFEST_VERSION, "generated_at": None, "settings": settings, "issues": {}}
+    try:
+        manifest = json.loads((out_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return fresh
+    if (manifest.get("version"), manifest.get("settings")) != (MANIFEST_VERSION, settings):
+        return fresh
+    return manifest
+
+
+def save_manifest(out_dir, manifest):
+    write_text_if_changed(out_dir / MANIFEST_NAME, json.dumps(manifest, indent=2, sort_keys=True) + "\n")
+
+
+class Checkpoint:
+    """Append-only log of finished issues that --resume picks up from.
+
+    The first line identifies the run; each later line is one
+    ``[number, row]`` pair. The first save rewrites the file with every row
+    known so far, which also compacts what an interrupted run left behind;
+    later saves append only the rows recorded since, so checkpointing costs
+    the same per issue however large the run gets.
+    """
+
+    def __init__(self, out_dir, repo, query):
+        self.path = out_dir / CHECKPOINT_NAME
+        self.header = {"version": CHECKPOINT_VERSION, "repo": repo, "query": query}
+        self.pending = []
+        self.started = False
+
+    def load(self):
+        """Fold the log into ``{number: row}``; a line cut short by a crash ends it."""
+        try:
+            lines = self.path.read_text(encoding="utf-8").splitlines()
+            if not lines or json.loads(lines[0]) != self.header:
+                return {}
+        except (OSError, ValueError):
+            return {}
+        rows = {}
+        for line in lines[1:]:
+            try:
+                number, row = json.loads(line)
+            except (TypeError, ValueError):
+                break
+            rows[number] = row
+        return rows
+
+    def record(self, number):
+        self.pending.append(number)
+
+    def save(self, rows):
+        numbers = rows if not self.started else self.pending
+        lines = [json.dumps([number, rows[number]]) + "\n" for number in numbers]
+        if self.started:
+            with self.path.open("a", encoding="utf-8") as handle:
+                handle.writelines(lines)
+        else:
+            atomic_write_text(self.path, json.dumps(self.header) + "\n" + "".join(lines))
+            self.started = True
+        self.pending = []
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+def ordered_map(executor, fn, items, window):
+    """Like executor.map, but pulls from ``items`` lazily with at most ``window`` tasks in flight."""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def render_index(repo, query, rows):
+    lines = [
         "# TiDB Customer Issue Experiences",
         "",
-        f"- Repository: `{args.repo}`",
-        f"- Source Query: `{args.query}`",
-        f"- Total Issues: {len(issues)}",
+        f"- Repository: `{repo}`",
+        f"- Source Query: `{query}`",
+        f"- Total Issues: {len(rows)}",
         "",
         "| Issue | Status | Type | Linked PR Count | File |",
         "| --- | --- | --- | ---: | --- |",
     ]
+    for number in sorted(rows, reverse=True):
+        row = rows[number]
+        lines.append(
+            f"| #{number} | {row['state']} | {row['type']} | {row['pr_count']} | [{row['file']}](./{row['file']}) |"
+        )
+    return "\n".join(lines) + "\n"
 
-    for idx, issue in enumerate(issues, start=1):
-        issue_number = issue["number"]
-        timeline = fetch_timeline(args.repo, issue_number)
-        pr_numbers, explicit_prs = parse_pr_numbers_from_timeline(timeline)
-        issue_created_at = parse_iso8601(issue.get("created_at"))
-        prs = []
 
-        for pr_number in pr_numbers:
-            try:
-                pr = fetch_pr(args.repo, pr_number)
-                body = pr.get("body", "") or ""
-                pr_created_at = parse_iso8601(pr.get("created_at"))
-                relation = "timeline_ref"
-
-                if pr_number in explicit_prs:
-                    relation = "explicit_fix"
-                elif re.search(rf"\b(?:fix|fixed|close|closed|resolve|resolved)\s+#?{issue_number}\b", body, re.I):
-                    relation = "explicit_fix"
-                elif re.search(rf"\bIssue Number:\s*(?:fix|fixed|close|closed|ref)\s+#?{issue_number}\b", body, re.I):
-                    relation = "explicit_fix"
-
-                if relation != "explicit_fix" and issue_created_at and pr_created_at:
-                    if pr_created_at < issue_created_at - timedelta(days=14):
-                        continue
-
-                files = fetch_pr_files(args.repo, pr_number)
-                top_buckets, sample_files = summarize_files(files)
-                prs.append(
-                    {
-                        "number": pr["number"],
-                        "title": pr["title"],
-                        "html_url": pr["html_url"],
-                        "state": pr["state"],
-                        "merged_at": pr.get("merged_at"),
-                        "files": files,
-                        "top_buckets": top_buckets,
-                        "sample_files": sample_files,
-                        "body_summary": summarize_pr_body(body),
-                        "relation": relation,
-                    }
+def issue_record(issue, prs, filename):
+    merged = sorted(pr["merged_at"] for pr in prs if pr.get("merged_at"))
+    return {
+        "number": issue["number"],
+        "title": issue["title"],
+        "url": issue.get("html_url", ""),
+        "state": issue["state"],
+        "type": issue_type(issue["labels"]),
+        "labels": label_names(issue["labels"]),
+        "created_at": issue.get("created_at"),
+        "closed_at": issue.get("closed_at"),
+        "updated_at": issue.get("updated_at"),
+        "file": filename,
+        "phenomenon": extract_phenomenon(issue.get("body", "")),
+        "first_merged_at": merged[0] if merged else None,
+        "prs": [
+            {
+                "number": pr["number"],
+                "title": pr["title"],
+                "url": pr["html_url"],
+                "state": pr["state"],
+                "relation": pr["relation"],
+                "merged_at": pr.get("merged_at"),
+                "top_buckets": pr["top_buckets"],
+                "changed_files": pr["changed_files"],
+                "files_sampled": pr["files_sampled"],
+                "summary": pr["body_summary"],
+                "files": [f["filename"] for f in pr["files"]],
+            }
+            for pr in prs
+        ],
+    }
+
+
+def read_jsonl(path):
+    try:
+        with path.open(encoding="utf-8") as handle:
+            return [json.loads(line) for line in handle if line.strip()]
+    except (OSError, ValueError):
+        return []
+
+
+class JsonlExporter:
+    """Collects one JSON record per issue and writes issues.jsonl at the end of the run.
+
+    The export is only rewritten when its content changed. Records that
+    differ from the previous export are appended to a ``.partial`` file at
+    every flush, so a resumed run can recover them for the issues in its
+    checkpoint; unchanged records are recovered from the previous export,
+    which is also where issues reused by --incremental copy theirs from.
+    """
+
+    def __init__(self, out_dir, resumed_numbers):
+        self.path = out_dir / EXPORT_JSONL_NAME
+        self.partial = self.path.with_name(f"{self.path.name}.partial")
+        self.previous = {record["number"]: record for record in read_jsonl(self.path)}
+        recovered = {record["number"]: record for record in read_jsonl(self.partial)}
+        self.lines = []
+        self.pending = []
+        for number in resumed_numbers:
+            record = recovered.get(number) or self.previous.get(number)
+            if record:
+                self.write(record)
+
+    def write(self, record):
+        line = json.dumps(record, ensure_ascii=False, sort_keys=True) + "\n"
+        self.lines.append(line)
+        if self.previous.get(record["number"]) != record:
+            self.pending.append(line)
+
+    def flush(self):
+        """Append changed records to the ``.partial`` file; returns whether it wrote."""
+        if not self.pending:
+            return False
+        with self.partial.open("a", encoding="utf-8") as handle:
+            handle.writelines(self.pending)
+        self.pending = []
+        return True
+
+    def finish(self):
+        """Write the export if it changed; returns ``(path, changed)``."""
+        changed = write_text_if_changed(self.path, "".join(self.lines))
+        self.partial.unlink(missing_ok=True)
+        return self.path, changed
+
+
+class CorpusWriter:
+    """Holds the file changes of the issue being finished until ``flush``.
+
+    ``run`` flushes once per issue, so this batches nothing across issues;
+    it only orders one issue's changes so its new file lands before the file
+    it was renamed from is removed. Each file is written atomically, and
+    content identical to what is on disk is not rewritten, so a rerun over
+    unchanged data leaves the directory alone.
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.staged = {}
+        self.removed = set()
+        self.written = 0
+        self.unchanged = 0
+
+    def stage(self, name, text):
+        self.staged[name] = text
+        self.removed.discard(name)
+
+    def remove(self, name):
+        self.staged.pop(name, None)
+        self.removed.add(name)
+
+    def flush(self):
+        """Apply staged writes and removals; returns whether anything on disk changed."""
+        changed = False
+        for name, text in self.staged.items():
+            if write_text_if_changed(self.out_dir / name, text):
+                self.written += 1
+                changed = True
+            else:
+                self.unchanged += 1
+        for name in self.removed:
+            path = self.out_dir / name
+            if path.exists():
+                path.unlink()
+                changed = True
+        self.staged = {}
+        self.removed = set()
+        return changed
+
+    def summary(self):
+        return f"[write] {self.written} files written, {self.unchanged} unchanged and skipped"
+
+
+def write_parquet(jsonl_path, parquet_path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise RuntimeError("--parquet requires pyarrow (pip install pyarrow)") from exc
+    pq.write_table(pa.Table.from_pylist(read_jsonl(jsonl_path)), parquet_path)
+
+
+def write_text_if_changed(path, text):
+    """Atomically replace ``path`` with ``text`` unless it already holds exactly that; returns whether it wrote."""
+    try:
+        if path.read_text(encoding="utf-8") == text:
+            return False
+    except OSError:
+        pass
+    atomic_write_text(path, text)
+    return True
+
+
+def atomic_write_text(path, text):
+    """Replace ``path`` with ``text`` through a temporary file renamed over it.
+
+    The temporary name is unique per process and thread, so concurrent
+    writers of the same path never share one; the last rename wins.
+    """
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_text(text, encoding="utf-8")
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+
+def fetch_pr_changes_since(repo, since):
+    """Return ``(updated_at by PR number, issue numbers mentioned)`` for PRs updated since ``since``.
+
+    The first element is None when the search hit the result cap, in which case
+    the caller cannot tell which linked PRs are unchanged.
+    """
+    items = fetch_search_issues(f"repo:{repo} is:pr updated:>={since}")
+    mentioned = set()
+    for item in items:
+        for num in re.findall(r"(?:#|/issues/)(\d+)", item.get("body") or ""):
+            mentioned.add(int(num))
+    if len(items) >= SEARCH_RESULT_CAP:
+        return None, mentioned
+    return {item["number"]: item.get("updated_at") for item in items}, mentioned
+
+
+def issue_is_current(entry, issue, out_dir, updated_prs, mentioned):
+    if not entry or entry.get("updated_at") != issue.get("updated_at"):
+        return False
+    if issue["number"] in mentioned:
+        return False
+    try:
+        if content_hash((out_dir / entry["file"]).read_text(encoding="utf-8")) != entry["hash"]:
+            return False
+    except OSError:
+        return False
+    if updated_prs is None:
+        return not entry["prs"]
+    for number, updated_at in entry["prs"].items():
+        if updated_at is None or updated_prs.get(int(number), updated_at) != updated_at:
+            return False
+    return True
+
+
+def report(args):
+    """Print the request and stage summary, and write the --trace file if requested."""
+    print(METRICS.summary(), flush=True)
+    if args.trace:
+        extra = {
+            "transport": TRANSPORT.name,
+            "wait_secs": {cause: round(secs, 3) for cause, secs in SCHEDULER.wait_secs.items()},
+            "retries": SCHEDULER.retries,
+            "permanent_failures": SCHEDULER.permanent_failures,
+        }
+        if RESPONSE_CACHE:
+            extra["cache"] = dict(RESPONSE_CACHE.stats)
+        METRICS.write_trace(args.trace, extra)
+        print(f"[trace] wrote {args.trace}", flush=True)
+
+
+def main(argv=None):
+    global METRICS
+    args = parse_args(argv)
+    METRICS = Instrumentation(trace=bool(args.trace))
+    try:
+        run(args)
+    finally:
+        report(args)
+
+
+def run(args):
+    global CLOCK, MODULE_BUCKETER, RESPONSE_CACHE, SCHEDULER, TRANSPORT
+    out_dir = Path(args.out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if args.replay:
+        TRANSPORT = ReplayTransport(args.replay)
+        CLOCK = TRANSPORT.recorded_at
+        SCHEDULER = RateLimitScheduler(UNTHROTTLED_RESOURCES)
+    else:
+        TRANSPORT = make_transport(args.transport, args.api_url)
+        if args.record:
+            TRANSPORT = RecordingTransport(TRANSPORT, args.record)
+            CLOCK = TRANSPORT.started_at
+    if not (args.no_cache or args.record or args.replay):
+        RESPONSE_CACHE = ResponseCache(args.cache_dir, max_age=args.cache_max_age, api_url=args.api_url)
+    MODULE_BUCKETER = ModuleBucketer.for_repo(args.repo, args.module_rules)
+
+    settings = {"module_rules": MODULE_BUCKETER.digest, "full_file_lists": args.full_file_lists}
+    manifest = load_manifest(out_dir, settings) if args.incremental else None
+    updated_prs, mentioned = {}, set()
+    if manifest and manifest["generated_at"]:
+        updated_prs, mentioned = fetch_pr_changes_since(args.repo, manifest["generated_at"])
+    run_started_at = utc_now().strftime("%Y-%m-%dT%H:%M:%SZ")
+    reused = 0
+    refreshed = 0
+
+    # Index rows of finished issues keyed by issue number. They double as the
+    # checkpoint, so --resume skips every issue recorded here.
+    checkpoint = Checkpoint(out_dir, args.repo, args.query)
+    rows = checkpoint.load() if args.resume else {}
+    resumed = len(rows)
+    file_pages = None if args.full_file_lists else SAMPLED_FILE_PAGES
+    source = PullRequestStore(
+        GraphQLSource(args.repo, args.graphql_batch_size, file_pages)
+        if args.graphql
+        else RestSource(args.repo, file_pages)
+    )
+    exporter = None if args.no_jsonl else JsonlExporter(out_dir, list(rows))
+    writer = CorpusWriter(out_dir)
+    # A run that starts without an index keeps a partial one up to date, so a
+    # crash still leaves a browsable corpus; an existing index is only
+    # replaced once the run is complete.
+    partial_index = not (out_dir / "README.md").exists()
+
+    def finish_issue():
+        # The issue file and its export record reach the disk before the
+        # checkpoint that lets --resume skip the issue. An issue whose output
+        # was already on disk needs no checkpoint, so an unchanged rerun
+        # writes nothing.
+        with METRICS.stage("write"):
+            changed = writer.flush()
+            if exporter:
+                changed = exporter.flush() or changed
+        if changed:
+            with METRICS.stage("checkpoint"):
+                checkpoint.save(rows)
+
+    def flush_batch():
+        # Issue files are flushed as they finish, so the manifest and index
+        # never point at output that is not on disk yet.
+        if manifest is not None:
+            save_manifest(out_dir, manifest)
+        if partial_index:
+            write_text_if_changed(out_dir / "README.md", render_index(args.repo, args.query, rows))
+
+    def pending_issues():
+        # Newest-first search order lets rendering start with the first page
+        # instead of waiting for the whole result set.
+        for page in iter_sharded_search_pages(args.query, sort="created", workers=args.concurrency):
+            batch = []
+            for issue in page:
+                if issue["number"] in rows:
+                    continue
+                current = False
+                if manifest is not None:
+                    entry = manifest["issues"].get(str(issue["number"]))
+                    current = issue_is_current(entry, issue, out_dir, updated_prs, mentioned)
+                    if exporter and issue["number"] not in exporter.previous:
+                        current = False
+                batch.append((issue, current))
+            source.plan([issue["number"] for issue, current in batch if not current])
+            yield from batch
+
+    def collect(item):
+        issue, current = item
+        if current:
+            return issue, None
+        return issue, fetch_issue_prs(source, args.repo, issue)
+
+    # Fetched issues wait here in order until their rendered output comes back.
+    jobs = deque()
+
+    def render_jobs(fetched):
+        for issue, prs in fetched:
+            filename = f"issue-{issue['number']}-{slugify(issue['title'])}.md"
+            jobs.append((issue, prs, filename))
+            yield issue, prs, filename, exporter is not None
+
+    with contextlib.ExitStack() as stack:
+        executor = stack.enter_context(ThreadPoolExecutor(max_workers=args.concurrency))
+        fetched = ordered_map(executor, collect, pending_issues(), args.concurrency * 2)
+        if args.render_processes:
+            # Spawned rather than forked: fetch threads may hold locks at fork time.
+            render_pool = stack.enter_context(
+                ProcessPoolExecutor(
+                    args.render_processes,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=init_render_worker,
+                    initargs=(MODULE_BUCKETER,),
                 )
-            except Exception as exc:
-                prs.append(
-                    {
-                        "number": pr_number,
-                        "title": f"Failed to fetch PR details: {exc}",
-                        "html_url": f"https://github.com/{args.repo}/pull/{pr_number}",
-                        "state": "unknown",
-                        "merged_at": None,
-                        "files": [],
-                        "top_buckets": [],
-                        "sample_files": [],
-                        "body_summary": "",
-                        "relation": "timeline_ref",
+            )
+            rendered_chunks = ordered_map(
+                render_pool, render_chunk, chunked(render_jobs(fetched), RENDER_CHUNK_SIZE), args.render_processes * 2
+            )
+            rendered_jobs = itertools.chain.from_iterable(rendered_chunks)
+        else:
+            rendered_jobs = map(render_job, render_jobs(fetched))
+        for output in rendered_jobs:
+            issue, prs, filename = jobs.popleft()
+            issue_number = issue["number"]
+            if prs is None:
+                entry = manifest["issues"][str(issue_number)]
+                filename = entry["file"]
+                pr_count = len(entry["prs"])
+                reused += 1
+                if exporter:
+                    exporter.write(exporter.previous[issue_number])
+            else:
+                rendered, record, render_secs = output
+                METRICS.record_stage("render", render_secs, issue=issue_number)
+                pr_count = len(prs)
+                refreshed += 1
+                writer.stage(filename, rendered)
+                if exporter:
+                    exporter.write(record)
+                if manifest is not None:
+                    previous = manifest["issues"].get(str(issue_number))
+                    if previous and previous["file"] != filename:
+                        writer.remove(previous["file"])
+                    manifest["issues"][str(issue_number)] = {
+                        "updated_at": issue.get("updated_at"),
+                        "file": filename,
+                        "hash": content_hash(rendered),
+                        "prs": {str(pr["number"]): pr.get("updated_at") for pr in prs},
                     }
-                )
-            time.sleep(SLEEP_SECS)
 
-        filename = f"issue-{issue_number}-{slugify(issue['title'])}.md"
-        path = out_dir / filename
-        path.write_text(render_issue(issue, prs), encoding="utf-8")
-
-        index_lines.append(
-            f"| #{issue_number} | {issue['state']} | {issue_type(issue['labels'])} | {len(prs)} | [{filename}](./{filename}) |"
-        )
+            rows[issue_number] = {
+                "state": issue["state"],
+                "type": issue_type(issue["labels"]),
+                "pr_count": pr_count,
+                "file": filename,
+            }
+            checkpoint.record(issue_number)
 
-        if idx % 10 == 0:
-            (out_dir / "README.md").write_text("\n".join(index_lines) + "\n", encoding="utf-8")
-            print(f"[progress] generated {idx}/{len(issues)} issues", flush=True)
+            if prs is not None:
+                finish_issue()
+            done = len(rows) - resumed
+            if done % WRITE_BATCH_SIZE == 0:
+                flush_batch()
+                print(f"[progress] generated {done} issues", flush=True)
 
-    (out_dir / "README.md").write_text("\n".join(index_lines) + "\n", encoding="utf-8")
-    print(f"[done] generated {len(issues)} issues into {out_dir}", flush=True)
+    flush_batch()
+    # The complete index is written once every issue file is in place.
+    write_text_if_changed(out_dir / "README.md", render_index(args.repo, args.query, rows))
+    if manifest is not None:
+        # Nothing fetched means nothing new to anchor the next incremental
+        # search on, so the manifest (and the disk) is left untouched.
+        if refreshed:
+            manifest["generated_at"] = run_started_at
+        save_manifest(out_dir, manifest)
+        print(f"[incremental] reused {reused} unchanged issues, refreshed {refreshed}", flush=True)
+    print(writer.summary(), flush=True)
+    if exporter:
+        jsonl_path, export_changed = exporter.finish()
+        parquet_path = out_dir / EXPORT_PARQUET_NAME
+        if args.parquet and (export_changed or not parquet_path.exists()):
+            write_parquet(jsonl_path, parquet_path)
+        if args.embed:
+            vector_rows, embedded = precedent_vectors.build_vectors(out_dir, args.embed_model)
+            print(f"[vectors] embedded {embedded} new or changed of {len(vector_rows)} issues", flush=True)
+    checkpoint.remove()
+    if args.index:
+        index = precedent_index.update_index(args.index, [out_dir])
+        print(f"[index] {len(index['docs'])} documents searchable via {args.index}", flush=True)
+    if resumed:
+        print(f"[resume] skipped {resumed} issues finished by the interrupted run", flush=True)
+    print(f"[done] generated {len(rows)} issues into {out_dir}", flush=True)
+    if args.graphql:
+        print(f"[graphql] fetched timelines and PRs with {source.source.queries} queries", flush=True)
+    print(source.summary(), flush=True)
+    if RESPONSE_CACHE:
+        print(RESPONSE_CACHE.summary(), flush=True)
+    print(SCHEDULER.summary(), flush=True)
 
 
 if __name__ == "__main__":
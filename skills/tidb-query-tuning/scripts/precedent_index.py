@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+from pathlib import Path
+
+
+REFERENCES_DIR = Path(__file__).resolve().parent.parent / "references"
+DEFAULT_DIRS = [
+    REFERENCES_DIR / "tidb-customer-planner-issues",
+    REFERENCES_DIR / "optimizer-oncall-experiences-redacted",
+]
+INDEX_NAME = ".precedent-index.json"
+DEFAULT_INDEX = REFERENCES_DIR / INDEX_NAME
+INDEX_VERSION = 1
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Title, label and module matches count more than a match in the body text.
+FIELD_WEIGHTS = {"title": 3, "labels": 2, "modules": 2, "body": 1}
+SKIPPED_SECTIONS = {"Metadata", "Notes"}
+STOPWORDS = frozenset(
+    "a an and are as at be but by can for from has have if in into is it its no not of on or "
+    "that the their then there these this to was were when which while will with".split()
+)
+
+TOKEN = re.compile(r"[a-z0-9_]+")
+HEADING = re.compile(r"^(#{1,6})\s+(.*)$")
+URL = re.compile(r"https?://\S+")
+CODE_FENCE = re.compile(r"`{3}[\s\S]*?`{3}")
+FILE_LINE = re.compile(r"^\s*-\s+([\w.-]+/[\w./-]+)\s*$")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Build and query a BM25 inverted index over the TiDB precedent corpora."
+    )
+    parser.add_argument(
+        "--index",
+        default=str(DEFAULT_INDEX),
+        help=f"Index file. Default: references/{INDEX_NAME}",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Create or incrementally refresh the index.")
+    build.add_argument(
+        "dirs",
+        nargs="*",
+        help="Markdown directories to index in addition to those already in the index. "
+        "Default: the customer issue and oncall experience corpora.",
+    )
+    query = sub.add_parser("query", help="Return the best matching precedents for a symptom description.")
+    query.add_argument("text", help="Free-text symptom, e.g. 'wrong index chosen for order by limit'.")
+    query.add_argument("-k", "--top-k", type=int, default=10, help="Number of results. Default: 10")
+    query.add_argument("--json", action="store_true", help="Print results as JSON.")
+    return parser.parse_args()
+
+
+def stem(token):
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [stem(token) for token in TOKEN.findall(text.lower()) if token not in STOPWORDS]
+
+
+def split_fields(markdown):
+    """Split a corpus markdown file into weighted fields.
+
+    The first ``#`` heading is the title, ``Labels:`` lines are labels, and
+    ``Main Modules:`` lines plus changed file paths are modules. Everything
+    else outside the Metadata and Notes sections, minus URLs and code
+    fences, is body text.
+    """
+    fields = {"title": "", "labels": "", "modules": "", "body": []}
+    section = None
+    for line in CODE_FENCE.sub("", markdown).splitlines():
+        heading = HEADING.match(line)
+        if heading:
+            if len(heading.group(1)) == 1 and not fields["title"]:
+                fields["title"] = heading.group(2)
+            else:
+                section = heading.group(2).strip()
+            continue
+        stripped = line.strip()
+        if stripped.startswith("- Labels:"):
+            fields["labels"] += " " + stripped[len("- Labels:") :]
+        elif stripped.startswith("Main Modules:"):
+            fields["modules"] += " " + stripped[len("Main Modules:") :]
+        elif FILE_LINE.match(line):
+            fields["modules"] += " " + FILE_LINE.match(line).group(1).replace("/", " ")
+        elif section not in SKIPPED_SECTIONS and not stripped.startswith(("URL:", "Merged At:", "State:")):
+            fields["body"].append(URL.sub("", stripped))
+    fields["body"] = "\n".join(fields["body"])
+    return fields
+
+
+def document_terms(markdown):
+    fields = split_fields(markdown)
+    terms = Counter()
+    for name, weight in FIELD_WEIGHTS.items():
+        for token in tokenize(fields[name]):
+            terms[token] += weight
+    return fields["title"], terms
+
+
+def empty_index():
+    return {"dirs": [], "docs": {}, "postings": defaultdict(dict)}
+
+
+def load_index(index_path):
+    """Load an index as ``{"dirs", "docs", "postings"}`` with postings as ``term -> {doc_id: tf}``.
+
+    On disk documents are a list and postings refer to them by position as
+    flat ``[doc, tf, doc, tf, ...]`` lists, which keeps the file compact.
+    """
+    try:
+        stored = json.loads(Path(index_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return empty_index()
+    if stored.get("version") != INDEX_VERSION:
+        return empty_index()
+    doc_ids = [doc["path"] for doc in stored["docs"]]
+    postings = defaultdict(dict)
+    for term, flat in stored["postings"].items():
+        postings[term] = {doc_ids[flat[i]]: flat[i + 1] for i in range(0, len(flat), 2)}
+    return {
+        "dirs": stored["dirs"],
+        "docs": {doc.pop("path"): doc for doc in stored["docs"]},
+        "postings": postings,
+    }
+
+
+def save_index(index_path, index):
+    index_path = Path(index_path)
+    doc_ids = sorted(index["docs"])
+    position = {doc_id: i for i, doc_id in enumerate(doc_ids)}
+    stored = {
+        "version": INDEX_VERSION,
+        "dirs": index["dirs"],
+        "docs": [{"path": doc_id, **index["docs"][doc_id]} for doc_id in doc_ids],
+        "postings": {
+            term: [value for doc_id, tf in sorted(docs.items()) for value in (position[doc_id], tf)]
+            for term, docs in sorted(index["postings"].items())
+            if docs
+        },
+    }
+    tmp = index_path.with_name(f"{index_path.name}.tmp")
+    tmp.write_text(json.dumps(stored, separators=(",", ":")), encoding="utf-8")
+    os.replace(tmp, index_path)
+
+
+def remove_document(index, doc_id):
+    for docs in index["postings"].values():
+        docs.pop(doc_id, None)
+    index["docs"].pop(doc_id, None)
+
+
+def refresh_index(index_path, dirs=()):
+    """Bring the index in line with its directories, re-tokenizing only changed files.
+
+    Documents are keyed by path relative to the index file. Files whose
+    size and mtime are unchanged are skipped without reading them; files
+    that were touched but whose content hash is unchanged only get new
+    stat data. Returns ``(index, changed)``.
+    """
+    index_path = Path(index_path)
+    base = index_path.resolve().parent
+    index = load_index(index_path)
+    known_dirs = set(index["dirs"])
+    known_dirs.update(os.path.relpath(Path(d).resolve(), base) for d in dirs)
+    index["dirs"] = sorted(known_dirs)
+
+    changed = False
+    seen = set()
+    for rel_dir in index["dirs"]:
+        for path in sorted((base / rel_dir).rglob("*.md")):
+            if path.name == "README.md":
+                continue
+            doc_id = os.path.relpath(path, base)
+            seen.add(doc_id)
+            stat = path.stat()
+            doc = index["docs"].get(doc_id)
+            if doc and doc["size"] == stat.st_size and doc["mtime_ns"] == stat.st_mtime_ns:
+                continue
+            changed = True
+            text = path.read_text(encoding="utf-8")
+            digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+            if doc and doc["hash"] == digest:
+                doc["size"], doc["mtime_ns"] = stat.st_size, stat.st_mtime_ns
+                continue
+            if doc:
+                remove_document(index, doc_id)
+            title, terms = document_terms(text)
+            for term, tf in terms.items():
+                index["postings"][term][doc_id] = tf
+            index["docs"][doc_id] = {
+                "title": title,
+                "hash": digest,
+                "length": sum(terms.values()),
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+            }
+    for doc_id in set(index["docs"]) - seen:
+        remove_document(index, doc_id)
+        changed = True
+    return index, changed
+
+
+def update_index(index_path, dirs=()):
+    index, changed = refresh_index(index_path, dirs)
+    if changed or not Path(index_path).exists():
+        save_index(index_path, index)
+    return index
+
+
+def search(index, text, top_k=10):
+    doc_count = len(index["docs"])
+    avg_length = sum(doc["length"] for doc in index["docs"].values()) / doc_count if doc_count else 1.0
+    scores = Counter()
+    for term in set(tokenize(text)):
+        postings = index["postings"].get(term)
+        if not postings:
+            continue
+        idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+        for doc_id, tf in postings.items():
+            length = index["docs"][doc_id]["length"]
+            norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_length)
+            scores[doc_id] += idf * tf * (BM25_K1 + 1) / norm
+    return [
+        {"score": round(score, 3), "path": doc_id, "title": index["docs"][doc_id]["title"]}
+        for doc_id, score in scores.most_common(top_k)
+    ]
+
+
+def main():
+    args = parse_args()
+    if args.command == "build":
+        started = time.perf_counter()
+        index = update_index(args.index, args.dirs or DEFAULT_DIRS)
+        elapsed = (time.perf_counter() - started) * 1000
+        terms = sum(1 for docs in index["postings"].values() if docs)
+        print(f"[index] {len(index['docs'])} documents, {terms} terms in {elapsed:.0f} ms -> {args.index}")
+        return
+
+    started = time.perf_counter()
+    index, changed = refresh_index(args.index, [] if Path(args.index).exists() else DEFAULT_DIRS)
+    if changed:
+        try:
+            save_index(args.index, index)
+        except OSError:
+            pass
+    results = search(index, args.text, args.top_k)
+    elapsed = (time.perf_counter() - started) * 1000
+    base = Path(args.index).resolve().parent
+    for result in results:
+        result["path"] = os.path.normpath(base / result["path"])
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+        return
+    for result in results:
+        print(f"{result['score']:7.3f}  {result['path']}\n         {result['title']}")
+    print(f"[query] {len(results)} results in {elapsed:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:
+        print(str(exc), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+
+REFERENCES_DIR = Path(__file__).resolve().parent.parent / "references"
+DEFAULT_CORPUS_DIR = REFERENCES_DIR / "tidb-customer-planner-issues"
+EXPORT_JSONL_NAME = "issues.jsonl"
+VECTORS_NAME = ".precedent-vectors.f32"
+VECTORS_META_NAME = ".precedent-vectors.json"
+VECTORS_VERSION = 2
+DEFAULT_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+DEFAULT_BATCH_SIZE = 32
+MAX_SUMMARY_CHARS = 600
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Build and query a local embedding index over the generated customer issue corpus."
+    )
+    parser.add_argument(
+        "--corpus-dir",
+        default=str(DEFAULT_CORPUS_DIR),
+        help=f"Corpus directory containing {EXPORT_JSONL_NAME}. Default: references/tidb-customer-planner-issues",
+    )
+    parser.add_argument(
+        "--model",
+        default=DEFAULT_MODEL,
+        help=f"sentence-transformers model name or local path. Default: {DEFAULT_MODEL}",
+    )
+    parser.add_argument(
+        "--allow-download",
+        action="store_true",
+        help="Allow fetching the model from the Hugging Face hub. By default only the local copy is used.",
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("build", help="Embed new or changed issues and rewrite the vector matrix.")
+    build.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help=f"Texts per model call. Default: {DEFAULT_BATCH_SIZE}",
+    )
+    query = sub.add_parser("query", help="Return the issues most similar to one or more symptom descriptions.")
+    query.add_argument("text", nargs="+", help="Free-text symptom; several texts are searched in one batch.")
+    query.add_argument("-k", "--top-k", type=int, default=10, help="Results per query. Default: 10")
+    query.add_argument("--json", action="store_true", help="Print results as JSON.")
+    return parser.parse_args()
+
+
+def embedding_text(record):
+    """Text embedded for one issue: title, phenomenon and linked PR titles and summaries."""
+    parts = [record["title"], record.get("phenomenon") or ""]
+    for pr in record.get("prs", []):
+        parts.append(pr["title"])
+        parts.append((pr.get("summary") or "")[:MAX_SUMMARY_CHARS])
+    return "\n".join(part for part in parts if part)
+
+
+def text_hash(model_name, text):
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+def import_numpy():
+    try:
+        import numpy
+    except ImportError as exc:
+        raise RuntimeError("vector search requires numpy (pip install numpy sentence-transformers)") from exc
+    return numpy
+
+
+def load_model(model_name, allow_download=False):
+    """Load a sentence-transformers model, from the local cache only unless ``allow_download``."""
+    if not allow_download:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+    try:
+        from sentence_transformers import SentenceTransformer
+    except ImportError as exc:
+        raise RuntimeError("vector search requires sentence-transformers (pip install sentence-transformers)") from exc
+    try:
+        return SentenceTransformer(model_name)
+    except OSError as exc:
+        raise RuntimeError(
+            f"model {model_name} is not available locally; run once with --allow-download or pass a local path"
+        ) from exc
+
+
+def encode(model, texts, batch_size=DEFAULT_BATCH_SIZE):
+    numpy = import_numpy()
+    vectors = model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    return numpy.asarray(vectors, dtype=numpy.float32)
+
+
+def load_meta(corpus_dir):
+    try:
+        meta = json.loads((Path(corpus_dir) / VECTORS_META_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if meta.get("version") != VECTORS_VERSION:
+        return None
+    return meta
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as handle:
+        for block in iter(lambda: handle.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def open_matrix(corpus_dir, meta):
+    """Memory-map the stored ``rows x dim`` float32 matrix read-only.
+
+    Returns None when the matrix is missing or is not the one ``meta`` was
+    written for, e.g. after a crash between replacing the matrix and its meta.
+    """
+    numpy = import_numpy()
+    path = Path(corpus_dir) / VECTORS_NAME
+    if not meta or not meta["rows"]:
+        return None
+    shape = (len(meta["rows"]), meta["dim"])
+    try:
+        if path.stat().st_size != shape[0] * shape[1] * 4 or file_sha256(path) != meta["sha256"]:
+            return None
+        return numpy.memmap(path, dtype=numpy.float32, mode="r", shape=shape)
+    except (OSError, ValueError):
+        return None
+
+
+def read_records(corpus_dir):
+    path = Path(corpus_dir) / EXPORT_JSONL_NAME
+    try:
+        with path.open(encoding="utf-8") as handle:
+            records = [json.loads(line) for line in handle if line.strip()]
+    except OSError as exc:
+        raise RuntimeError(f"{path} not found; run generate_tidb_issue_experiences.py without --no-jsonl") from exc
+    return sorted(records, key=lambda record: record["number"], reverse=True)
+
+
+def build_vectors(corpus_dir, model_name=DEFAULT_MODEL, batch_size=DEFAULT_BATCH_SIZE, allow_download=False, model=None):
+    """Refresh the vector matrix of ``corpus_dir``, embedding only new or changed issues.
+
+    Rows follow the export sorted by issue number. A row is reused when the
+    hash of its model name and embedded text is unchanged, so the model is
+    not even loaded when nothing changed. The matrix and its meta are each
+    written to a temporary file and renamed over the old one; the meta
+    records the matrix digest, so a crash between the two renames leaves a
+    pair that ``open_matrix`` rejects. Returns ``(rows, embedded)``.
+    """
+    numpy = import_numpy()
+    corpus_dir = Path(corpus_dir)
+    records = read_records(corpus_dir)
+    meta = load_meta(corpus_dir)
+    old = open_matrix(corpus_dir, meta if meta and meta["model"] == model_name else None)
+    old_rows = {row["hash"]: i for i, row in enumerate(meta["rows"])} if old is not None else {}
+
+    rows, texts, missing = [], [], []
+    for record in records:
+        text = embedding_text(record)
+        digest = text_hash(model_name, text)
+        rows.append({"number": record["number"], "title": record["title"], "file": record["file"], "hash": digest})
+        if digest not in old_rows:
+            texts.append(text)
+            missing.append(len(rows) - 1)
+
+    if meta and old is not None and not missing and [row["hash"] for row in rows] == [row["hash"] for row in meta["rows"]]:
+        return rows, 0
+
+    fresh = None
+    if texts:
+        model = model or load_model(model_name, allow_download)
+        fresh = encode(model, texts, batch_size)
+    dim = fresh.shape[1] if fresh is not None else (meta["dim"] if meta else 0)
+
+    path = corpus_dir / VECTORS_NAME
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    if rows:
+        matrix = numpy.memmap(tmp, dtype=numpy.float32, mode="w+", shape=(len(rows), dim))
+        reused = [(i, old_rows[row["hash"]]) for i, row in enumerate(rows) if row["hash"] in old_rows]
+        if reused:
+            new_index, old_index = map(list, zip(*reused))
+            matrix[new_index] = old[old_index]
+        if missing:
+            matrix[missing] = fresh
+        matrix.flush()
+        del matrix, old
+    else:
+        tmp.write_bytes(b"")
+    meta = {"version": VECTORS_VERSION, "model": model_name, "dim": int(dim), "sha256": file_sha256(tmp), "rows": rows}
+    os.replace(tmp, path)
+    meta_path = corpus_dir / VECTORS_META_NAME
+    meta_tmp = meta_path.with_name(f"{meta_path.name}.{os.getpid()}.tmp")
+    meta_tmp.write_text(json.dumps(meta, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+    os.replace(meta_tmp, meta_path)
+    return rows, len(missing)
+
+
+def top_k(matrix, queries, k):
+    """Cosine top-k for a batch of normalized query vectors against normalized rows.
+
+    Returns one ``[(row, score), ...]`` list per query, best first.
+    """
+    numpy = import_numpy()
+    scores = queries @ matrix.T
+    k = min(k, scores.shape[1])
+    if k <= 0:
+        return [[] for _ in range(len(queries))]
+    best = numpy.argpartition(-scores, k - 1, axis=1)[:, :k]
+    best_scores = numpy.take_along_axis(scores, best, axis=1)
+    order = numpy.argsort(-best_scores, axis=1)
+    best = numpy.take_along_axis(best, order, axis=1)
+    best_scores = numpy.take_along_axis(best_scores, order, axis=1)
+    return [
+        [(int(row), float(score)) for row, score in zip(rows, row_scores)]
+        for rows, row_scores in zip(best, best_scores)
+    ]
+
+
+def search(corpus_dir, texts, k=10, model_name=DEFAULT_MODEL, allow_download=False, model=None):
+    corpus_dir = Path(corpus_dir)
+    meta = load_meta(corpus_dir)
+    if not meta:
+        raise RuntimeError(f"no vector index in {corpus_dir}; run precedent_vectors.py build first")
+    if meta["model"] != model_name:
+        raise RuntimeError(f"vector index in {corpus_dir} was built with {meta['model']}, not {model_name}")
+    matrix = open_matrix(corpus_dir, meta)
+    if matrix is None:
+        return [[] for _ in texts]
+    model = model or load_model(model_name, allow_download)
+    results = []
+    for hits in top_k(matrix, encode(model, list(texts)), k):
+        results.append(
+            [
+                {
+                    "score": round(score, 4),
+                    "number": meta["rows"][row]["number"],
+                    "title": meta["rows"][row]["title"],
+                    "path": str(corpus_dir / meta["rows"][row]["file"]),
+                }
+                for row, score in hits
+            ]
+        )
+    return results
+
+
+def main():
+    args = parse_args()
+    started = time.perf_counter()
+    if args.command == "build":
+        rows, embedded = build_vectors(args.corpus_dir, args.model, args.batch_size, args.allow_download)
+        elapsed = time.perf_counter() - started
+        print(f"[vectors] {len(rows)} issues, embedded {embedded} new or changed in {elapsed:.1f}s -> {args.corpus_dir}")
+        return
+
+    results = search(args.corpus_dir, args.text, args.top_k, args.model, args.allow_download)
+    elapsed = time.perf_counter() - started
+    if args.json:
+        print(json.dumps(results if len(args.text) > 1 else results[0], indent=2, ensure_ascii=False))
+        return
+    for text, hits in zip(args.text, results):
+        if len(args.text) > 1:
+            print(f"## {text}")
+        for hit in hits:
+            print(f"{hit['score']:7.4f}  #{hit['number']} {hit['title']}\n         {hit['path']}")
+    print(f"[query] {sum(map(len, results))} results in {elapsed:.1f}s", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as exc:
+        print(str(exc), file=sys.stderr)
+        sys.exit(1)
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""Golden test and micro-benchmark for generate_tidb_issue_experiences.sanitize_text.
+
+Run the checks with ``python -m pytest test_sanitize_text.py`` and the
+benchmark with ``python test_sanitize_text.py [--size KB] [--calls N]``.
+"""
+import argparse
+import random
+import re
+import time
+from pathlib import Path
+
+import generate_tidb_issue_experiences as generator
+
+
+CORPUS_DIR = Path(__file__).resolve().parent.parent / "references" / "tidb-customer-planner-issues"
+
+# Markup the sanitizer passes react to, mixed with prose so that passes
+# interact: URLs inside images, unterminated fences, stray backticks, etc.
+FRAGMENTS = [
+    "the optimizer picks a full table scan ",
+    "index_merge ",
+    "\n",
+    "\r\n",
+    "\n\n\n\n",
+    "# ",
+    "### Expected behavior\n",
+    "<!-- template comment -->",
+    "<!-- unterminated ",
+    "-->",
+    "https://github.com/pingcap/tidb/pull/123",
+    "https://github.com/",
+    "http://example.com/a(b)",
+    "https://",
+    "![plan](https://user-images.githubusercontent.com/1/2.png)",
+    "![plan](plan.png)",
+    "![",
+    "](",
+    "<img src=\"x.png\" width=300>",
+    "<img ",
+    "```sql\nselect * from t where a > 1;\n```",
+    "```",
+    "`tidb_opt_prefer_range_scan`",
+    "`",
+    ")",
+    "]",
+]
+
+
+def reference_sanitize_text(text):
+    """The original uncompiled regex chain, kept as the golden reference."""
+    text = text.replace("\r\n", "\n")
+    text = re.sub(r"<![\s\S]*?-->", "", text)
+    text = re.sub(r"https://github\.com/[^\s)]+", "", text)
+    text = re.sub(r"https?://[^\s)]+", "", text)
+    text = re.sub(r"!\[[^\]]*\]\([^)]+\)", "", text)
+    text = re.sub(r"<img[^>]*>", "", text)
+    text = re.sub(r"`{3}[\s\S]*?`{3}", "", text)
+    text = re.sub(r"`[^`]*`", "", text)
+    text = re.sub(r"^#+\s*", "", text, flags=re.M)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def generated_body(rng, size):
+    parts, length = [], 0
+    while length < size:
+        part = rng.choice(FRAGMENTS)
+        parts.append(part)
+        length += len(part)
+    return "".join(parts)
+
+
+def test_matches_reference_on_corpus():
+    paths = sorted(CORPUS_DIR.glob("*.md"))
+    assert paths, f"no corpus files under {CORPUS_DIR}"
+    for path in paths:
+        text = path.read_text(encoding="utf-8")
+        assert generator.sanitize_text(text) == reference_sanitize_text(text), path.name
+
+
+def test_matches_reference_on_generated_bodies():
+    rng = random.Random(7)
+    bodies = [generated_body(rng, rng.randint(1, 400)) for _ in range(5000)]
+    bodies += [generated_body(rng, 200_000) for _ in range(5)]
+    for body in bodies:
+        assert generator.sanitize_text(body) == reference_sanitize_text(body), repr(body[:200])
+
+
+def test_skipped_passes_cannot_match():
+    # A pass is skipped when its trigger is absent from the text it would see,
+    # so every pattern match at that stage must contain the trigger.
+    rng = random.Random(11)
+    for _ in range(5000):
+        text = generated_body(rng, rng.randint(1, 300)).replace("\r\n", "\n")
+        for trigger, pattern, replacement in generator.SANITIZE_PASSES:
+            for match in pattern.finditer(text):
+                assert trigger in match.group(0), (trigger, match.group(0))
+            text = pattern.sub(replacement, text)
+
+
+def test_cached_result_is_stable():
+    generator.sanitize_text.cache_clear()
+    body = generated_body(random.Random(3), 10_000)
+    first = generator.sanitize_text(body)
+    assert generator.sanitize_text(body) == first
+    assert generator.sanitize_text.cache_info().hits == 1
+
+
+def benchmark(size_kb=100, calls=200):
+    """Time the reference chain and sanitize_text (uncached) on prose and markup-heavy bodies."""
+    rng = random.Random(1)
+    prose = ("the optimizer picks a full table scan instead of index_merge " * (size_kb * 20))[: size_kb * 1024]
+    cases = {"prose": prose, "markup": generated_body(rng, size_kb * 1024)}
+    uncached = generator.sanitize_text.__wrapped__
+    for name, body in cases.items():
+        for label, func in (("reference", reference_sanitize_text), ("sanitize_text", uncached)):
+            started = time.perf_counter()
+            for _ in range(calls):
+                func(body)
+            elapsed = (time.perf_counter() - started) * 1000
+            print(f"{name:>7} {size_kb} KB  {label:>14}: {elapsed:8.1f} ms for {calls} calls")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark sanitize_text against the original regex chain.")
+    parser.add_argument("--size", type=int, default=100, help="Body size in KB. Default: 100")
+    parser.add_argument("--calls", type=int, default=200, help="Calls per measurement. Default: 200")
+    args = parser.parse_args()
+    benchmark(args.size, args.calls)
+
+
+if __name__ == "__main__":
+    main()